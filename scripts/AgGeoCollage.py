@@ -1,57 +1,129 @@
 import sys 
+import os
 
-from typing import List 
+from typing import List, Optional
 
 from ProcessRegion import ProcessRegion
+from RegionScheduler import RegionScheduler
+from StagePipeline import StagePipeline
+from VectorFormat import VectorFormat
 from Utils.TmpFileUtils import TmpFileUtils
 
 class AgGeoCollage:
     ''' top level driver for creating aggregated collages '''
 
+    MAP_FMT         = "{region}2021.tif"
+
+    TMP_PREFIX      = "ctm2020_"
+    TMP_SUFFIX      = ".ag"
+
+    STORE_MODE      = ProcessRegion.STORE_LINK
+    ARCHIVE_SUBDIRS = ["workdir"]           # rasterized CLUs, only kept for reference
+
     def __init__ (self, datapath: str, 
                         clupath: str,
-                        workdir: str):
+                        workdir: str,
+                        incremental: bool = False,
+                        inmemory: bool = False):
         ''' initializer 
         
             @param clupath: where the CLU files are
             @param datapath: where the basemaps are
-            @param workdir: where the temporary files go '''
+            @param workdir: where the temporary files go (one subdirectory per region) 
+            @param incremental: if True, rebuild only the stages whose inputs or 
+                                parameters changed since the last run 
+            @param inmemory: if True, hand the merged and adjusted maps over 
+                             in memory (they are not stored) '''
 
         self.DataPath = datapath
         self.CLUPath = clupath 
         self.WorkDir = workdir 
-
-    def run (self, regions: List[str]): 
-        ''' perform full run '''
+        self.Incremental = incremental
+        self.InMemory = inmemory
+        self.StorePath = os.path.join (os.path.dirname (workdir), "production")
+
+    def run (self, regions: List[str], 
+                   workers: Optional[int] = None,
+                   budget: Optional[int] = None,
+                   ioslots: Optional[int] = None): 
+        ''' perform full run; regions are processed in parallel, largest first, 
+            within the memory budget, with their CPU and I/O stages pipelined 
+
+            @param regions: regions to process 
+            @param workers: CPU stages running at once (None for one per CPU) 
+            @param budget: memory budget in bytes (None for most of the host memory) 
+            @param ioslots: I/O stages running at once (None for a share of the CPU slots) '''
+
+        scheduler = StagePipeline.scheduler (cpu = workers,
+                                             io = ioslots,
+                                             budget = budget,
+                                             initializer = initWorker,
+                                             initargs = (self.TMP_PREFIX, self.TMP_SUFFIX),
+                                             verbose = True)
 
         for region in regions: 
-            prg = ProcessRegion (region,
-                                 datapath = self.DataPath,
-                                 clupath = self.CLUPath,
-                                 workpath = self.WorkDir,
-                                 mcqfilter = False,
-                                 mapfmt ="{region}2021.tif")
+            basemap = os.path.join (self.DataPath, self.MAP_FMT.format (region = region.upper ()))
+            clufile = ProcessRegion.CLU_FMT.format (region = region.lower ())
+            clufile = VectorFormat.locate (os.path.join (self.CLUPath, clufile))
 
-            prg.process ()
-            prg.store ()
+            scheduler.add (region, processRegion, 
+                           region, self.DataPath, self.CLUPath, self.WorkDir, self.StorePath,
+                           self.Incremental, self.InMemory,
+                           memory = RegionScheduler.estimateMemory (basemap, clufile))
+
+        scheduler.run ()
 
     @classmethod 
     def printUsage (clss):
         ''' print the help text on the usage of this app '''
 
-        sys.stderr.write ("\nUSAGE: [python3] {app} datapath clupath \n\n")
+        sys.stderr.write ("\nUSAGE: [python3] {app} datapath clupath [workers [memory-GB [io-slots [full|incremental|inmemory]]]]\n\n")
 
-# ................................... MAIN ..................................
+def initWorker (prefix: str, suffix: str):
+    ''' set up a worker process '''
 
-import os
+    TmpFileUtils.init (prefix = prefix, suffix = suffix)
+
+def processRegion (region: str, datapath: str, clupath: str, workdir: str, storepath: str,
+                   incremental: bool = False, inmemory: bool = False):
+    ''' process and store a single region, in its own work directory 
+
+        @param region: region name 
+        @param datapath: where the basemaps are 
+        @param clupath: where the CLU files are 
+        @param workdir: where the temporary files of all regions go 
+        @param storepath: where the results of all regions are stored 
+        @param incremental: if True, rebuild only the stages that changed 
+        @param inmemory: if True, hand stage results over in memory '''
+
+    prg = ProcessRegion (region,
+                         datapath = datapath,
+                         clupath = clupath,
+                         workpath = os.path.join (workdir, region.upper (), "workdir"),
+                         mcqfilter = False,
+                         mapfmt = AgGeoCollage.MAP_FMT,
+                         incremental = incremental,
+                         inmemory = inmemory)
+
+    prg.process ()
+    StagePipeline.runStage (StagePipeline.IO, prg.store, storepath, 
+                            AgGeoCollage.STORE_MODE, AgGeoCollage.ARCHIVE_SUBDIRS)
+
+# ................................... MAIN ..................................
 
 if __name__ == "__main__":
     
-    if len (sys.argv[1:]) == 0:
+    REQUIRED_ARGS = 2
+    OPTIONAL_ARGS = 4
+
+    INCREMENTAL = "incremental"
+    INMEMORY    = "inmemory"
+
+    if not REQUIRED_ARGS <= len (sys.argv[1:]) <= REQUIRED_ARGS + OPTIONAL_ARGS:
         AgGeoCollage.printUsage ()
 
     else:
-        TmpFileUtils.init (prefix = "ctm2020_", suffix = ".ag")
+        TmpFileUtils.init (prefix = AgGeoCollage.TMP_PREFIX, suffix = AgGeoCollage.TMP_SUFFIX)
 
         REGIONS = ["AR", "KS", "KY", "MD", 
                    "MN", "MO", "NC", "NJ", 
@@ -65,10 +137,16 @@ if __name__ == "__main__":
 
         args = sys.argv[1:]
         nArgs = len (args) 
-        datapath, clupath = args 
+        datapath, clupath = args[:REQUIRED_ARGS]
+        workers = int (args[REQUIRED_ARGS]) if nArgs > REQUIRED_ARGS else None
+        budget = int (float (args[REQUIRED_ARGS + 1]) * (1 << 30)) if nArgs > REQUIRED_ARGS + 1 else None
+        ioslots = int (args[REQUIRED_ARGS + 2]) if nArgs > REQUIRED_ARGS + 2 else None
+        incremental = nArgs > REQUIRED_ARGS + 3 and args[REQUIRED_ARGS + 3] == INCREMENTAL
+        inmemory = nArgs > REQUIRED_ARGS + 3 and args[REQUIRED_ARGS + 3] == INMEMORY
 
         workdir = os.path.join (os.path.dirname (datapath), "workdir")
-        agc = AgGeoCollage (datapath, clupath, workdir)
-        agc.run (REGIONS)
-
-        TmpFileUtils.cleanup ()
\ No newline at end of file
+        agc = AgGeoCollage (datapath, clupath, workdir, incremental, inmemory)
+        try:
+            agc.run (REGIONS, workers, budget, ioslots)
+        finally:
+            TmpFileUtils.cleanup ()
\ No newline at end of file
@@ -0,0 +1,95 @@
+import json
+import os
+
+from typing import Any, Dict, Optional, Tuple
+
+from FileFingerprint import FileFingerprint
+
+class AreaCache:
+    ''' persistent cache of per-file area distributions; an entry is valid 
+        while the file keeps its size and modification time, or its content 
+        hash if those changed, and while the pixel area parameters are the same '''
+
+    VERSION         = 1
+
+    def __init__ (self, filename: str):
+        ''' initializer 
+
+            @param filename: where the cache is kept (JSON) '''
+
+        self.Filename = filename
+        self.Entries: Dict[str, Any] = {}
+        self.Dirty = False
+
+        if os.path.exists (self.Filename):
+            with open (self.Filename, "r") as f:
+                content = json.load (f)
+
+            if content.get ("version") == self.VERSION:
+                self.Entries = content["entries"]
+
+    def lookup (self, datafile: str, params: Dict[str, Any]) -> Optional[Tuple[Dict, Any]]:
+        ''' find cached areas for a file 
+
+            @param datafile: analyzed raster 
+            @param params: pixel area parameters the areas were computed with 
+            @return: (areas, no-data value) or None if there is no valid entry '''
+
+        result = None
+        key = os.path.abspath (datafile)
+        entry = self.Entries.get (key)
+
+        if entry is not None and entry["params"] == params and os.path.exists (datafile):
+            size, mtime = FileFingerprint.identity (datafile)
+            valid = size == entry["size"] and mtime == entry["mtime"]
+
+            if not valid and size == entry["size"]:
+                valid = FileFingerprint.digest (datafile) == entry["digest"]
+                if valid:
+                    entry["mtime"] = mtime
+                    self.Dirty = True
+
+            if valid:
+                areas = {value : area for value, area in entry["areas"]}
+                result = areas, entry["nodata"]
+
+        return result
+
+    def store (self, datafile: str, 
+                     params: Dict[str, Any], 
+                     areas: Dict, 
+                     noDataValue: Any,
+                     digest: Optional[str] = None):
+
+        ''' record areas of a file 
+
+            @param datafile: analyzed raster 
+            @param params: pixel area parameters the areas were computed with 
+            @param areas: {value : area} 
+            @param noDataValue: no-data value of the raster 
+            @param digest: content hash of the file, if already known '''
+
+        size, mtime = FileFingerprint.identity (datafile)
+
+        if digest is None:
+            digest = FileFingerprint.digest (datafile)
+
+        self.Entries[os.path.abspath (datafile)] = {"size"   : size,
+                                                    "mtime"  : mtime,
+                                                    "digest" : digest,
+                                                    "params" : params,
+                                                    "areas"  : list (areas.items ()),
+                                                    "nodata" : noDataValue}
+        self.Dirty = True
+
+    def save (self):
+        ''' write the cache, atomically, if anything changed '''
+
+        if self.Dirty:
+            tmpName = self.Filename + ".tmp"
+
+            with open (tmpName, "w") as f:
+                json.dump ({"version" : self.VERSION, "entries" : self.Entries}, f)
+
+            os.replace (tmpName, self.Filename)
+            self.Dirty = False
@@ -0,0 +1,293 @@
+import math
+import random
+
+from typing import Any, Dict, Optional, Tuple, Union
+
+from Reprojector import Reprojector
+from GeoTransform import GeoTransform
+from RasterUtils import RasterUtils
+
+from TempStorage import TempStorage
+
+from Utils.UnitUtils import UnitUtils
+
+from osgeo import gdalconst as GConst  
+from osgeo import gdal 
+
+import numpy as NPy
+
+class AreaCounter:
+    ''' calculates area (in acres) covered by each pixel value of a raster, 
+        directly in the raster's own projection whenever possible '''
+
+    WORK_PROJ4      = "+proj=aea +lat_1=29.5 +lat_2=45.5 +lat_0=23 +lon_0=-96 +x_0=0 +y_0=0 +ellps=GRS80 +datum=NAD83 +towgs84=0,0,0,0,0,0,0 +units=m +no_defs"
+
+    AREA_MODEL      = 1     # bump whenever the way areas are computed changes
+
+    ESTIMATES       = [(OVERVIEW := "overview"),
+                       (SAMPLE   := "sample")]
+
+    SAMPLE_FRACTION     = 0.02
+    SAMPLE_SEED         = 20210901
+    MIN_SAMPLE_BLOCKS   = 64
+    MIN_SAMPLE_PIXELS   = 1 << 20
+    Z95                 = 1.96
+
+    NEAREST_RESAMPLINGS = ["NEAREST", "NEAR"]
+
+    TAreaDists = Dict[Union[int, float], float]
+    TNoDataValue = Union[int, float, None]
+    TSummary = Dict[str, Any]
+
+    def __init__ (self, workproj4: str = WORK_PROJ4):
+        ''' initializer 
+
+            @param workproj4: equal area projection to warp to when pixel 
+                              areas cannot be computed in the source projection '''
+
+        self.WorkProjection = workproj4
+
+    def parameters (self) -> Dict[str, Any]:
+        ''' parameters that determine the computed areas (e.g. for caching) '''
+
+        return {"model"     : self.AREA_MODEL,
+                "workproj4" : self.WorkProjection}
+
+    def calculate (self, filename: str) -> Tuple[TAreaDists, TNoDataValue]:
+        ''' calculate areas of all values present in a raster; equal area 
+            projections use a constant pixel area, geographic and cylindrical 
+            ones a per-row pixel area vector, anything else is warped to the 
+            work projection first (into RAM while the temporary budget lasts) 
+
+            @param filename: raster to analyze 
+            @return: {value : acres} without the no-data value, and the no-data value '''
+
+        ds = gdal.Open (filename, GConst.GA_ReadOnly)
+        band = ds.GetRasterBand (1)
+        noDataValue = band.GetNoDataValue ()
+        summary = self.summarize (GeoTransform (dataset = ds), band = band)
+        ds = None
+
+        if summary is not None:
+            areas = self.toAcres (summary, noDataValue)
+        else:
+            size = TempStorage.rasterSize (filename, TempStorage.WARP_GROWTH)
+            with TempStorage.temporary (filename, size) as workmap:
+                Reprojector ().warpRaster (filename, workmap, self.WorkProjection)
+                areas, noDataValue = self.calculate (workmap)
+
+        return areas, noDataValue
+
+    def summarize (self, gtrans: GeoTransform, 
+                         band = None, 
+                         data: Optional[NPy.ndarray] = None) -> Optional[TSummary]:
+
+        ''' pixel counts and pixel areas (in square meters) of all values, 
+            read from a band or from pixel data already in memory 
+
+            @param gtrans: geo-transformation of the raster 
+            @param band: band to read (if data is None) 
+            @param data: 2D array of all pixels of the band 
+            @return: {"counts" : {value : n} or None, 
+                      "pixelArea" : constant pixel area or None, 
+                      "areas" : {value : area} or None}, 
+                     None if areas cannot be computed in this projection '''
+
+        result = None
+
+        def histogram (weights = None):
+            if data is None:
+                return RasterUtils.histogram (band, weights)
+            return RasterUtils.arrayHistogram (data, weights)
+
+        if gtrans.isEqualArea ():
+            result = {"counts"    : histogram (),
+                      "pixelArea" : gtrans.getMetricPixelArea (),
+                      "areas"     : None}
+
+        elif gtrans.isRowSeparable ():
+            nRows = band.YSize if data is None else data.shape[0]
+            result = {"counts"    : histogram () if data is not None else None,
+                      "pixelArea" : None,
+                      "areas"     : histogram (gtrans.getRowPixelAreas (nRows))}
+
+        return result 
+
+    def toAcres (self, summary: TSummary, noDataValue: TNoDataValue) -> TAreaDists:
+        ''' convert a summary into areas in acres 
+
+            @param summary: summary from summarize () 
+            @param noDataValue: value to leave out 
+            @return: {value : acres} '''
+
+        if summary["pixelArea"] is not None:
+            pixelArea = UnitUtils.acres (meters = summary["pixelArea"])
+            areas = {value : count * pixelArea for value, count in summary["counts"].items ()}
+        else:
+            areas = {value : UnitUtils.acres (meters = area) for value, area in summary["areas"].items ()}
+
+        if noDataValue is not None:
+            areas = {value : area for value, area in areas.items () if value != noDataValue}
+
+        return areas
+
+    def estimate (self, filename: str, 
+                        method: str = SAMPLE,
+                        fraction: float = SAMPLE_FRACTION) -> Tuple[TAreaDists, TAreaDists, TNoDataValue]:
+
+        ''' estimate areas of all values from a part of the pixels, with an 
+            error bound (95 % confidence half-width, in acres) for each value 
+
+            @param filename: raster to analyze 
+            @param method: OVERVIEW (smallest nearest-sampled overview with 
+                           enough pixels, falls back to SAMPLE if there is none) 
+                           or SAMPLE (stratified sample of blocks) 
+            @param fraction: fraction of blocks to read for SAMPLE 
+            @return: {value : acres}, {value : error bound}, no-data value; 
+                     rasters that would need a warp are counted exactly '''
+
+        if method not in self.ESTIMATES:
+            raise ValueError (f"Unknown estimate method '{method}'")
+
+        ds = gdal.Open (filename, GConst.GA_ReadOnly)
+        band = ds.GetRasterBand (1)
+        noDataValue = band.GetNoDataValue ()
+        gtrans = GeoTransform (dataset = ds)
+
+        if not (gtrans.isEqualArea () or gtrans.isRowSeparable ()):
+            ds = None
+            areas, noDataValue = self.calculate (filename)
+            result = areas, {value : 0.0 for value in areas}, noDataValue
+
+        else:
+            rowAreas = gtrans.getRowPixelAreas (ds.RasterYSize)
+            overview = self.pickOverview (band) if method == self.OVERVIEW else None
+
+            if overview is not None:
+                areas, bounds = self.estimateFromOverview (band, overview, rowAreas)
+            else:
+                areas, bounds = self.estimateFromBlocks (band, rowAreas, fraction)
+
+            ds = None
+
+            areas = {value : UnitUtils.acres (meters = area) for value, area in areas.items ()}
+            bounds = {value : UnitUtils.acres (meters = bound) for value, bound in bounds.items ()}
+
+            if noDataValue is not None:
+                areas = {value : area for value, area in areas.items () if value != noDataValue}
+                bounds = {value : bound for value, bound in bounds.items () if value != noDataValue}
+
+            result = areas, bounds, noDataValue
+
+        return result
+
+    def pickOverview (self, band):
+        ''' smallest overview with at least MIN_SAMPLE_PIXELS pixels; only 
+            nearest-sampled overviews are a sample of the full resolution 
+            pixels (e.g. MODE or AVERAGE ones are biased towards the majority) 
+
+            @param band: full resolution band 
+            @return: overview band or None '''
+
+        result = None
+
+        for iOverview in range (band.GetOverviewCount ()):
+            overview = band.GetOverview (iOverview)
+            nPixels = overview.XSize * overview.YSize
+
+            if self.isNearest (band, overview) and \
+               nPixels >= self.MIN_SAMPLE_PIXELS and \
+               (result is None or nPixels < result.XSize * result.YSize):
+                result = overview
+
+        return result
+
+    def isNearest (self, band, overview) -> bool:
+        ''' check whether an overview was built by nearest sampling, from the 
+            RESAMPLING metadata of the overview or of the band (COG products 
+            record it, see ProductFinalizer.makeCOG); overviews without it 
+            are not trusted 
+
+            @param band: full resolution band 
+            @param overview: overview band 
+            @return: True if the overview pixels are full resolution pixels '''
+
+        resampling = overview.GetMetadataItem ("RESAMPLING") or band.GetMetadataItem ("RESAMPLING")
+
+        return resampling is not None and resampling.upper () in self.NEAREST_RESAMPLINGS
+
+    def estimateFromOverview (self, band, overview, rowAreas: NPy.ndarray) -> Tuple[Dict, Dict]:
+        ''' estimate areas from an overview; every overview pixel stands for 
+            the full resolution pixels under it, the bound treats overview 
+            pixels as a simple random sample of the full resolution ones 
+
+            @param band: full resolution band 
+            @param overview: overview band 
+            @param rowAreas: full resolution per-row pixel areas (square meters) 
+            @return: areas and error bounds by value (square meters) '''
+
+        yScale = band.YSize / overview.YSize
+        xScale = band.XSize / overview.XSize
+
+        centerRows = ((NPy.arange (overview.YSize) + 0.5) * yScale).astype (NPy.int64)
+        ovrRowAreas = rowAreas[centerRows] * xScale * yScale
+
+        areas = RasterUtils.histogram (overview, ovrRowAreas)
+        counts = RasterUtils.histogram (overview)
+
+        totalArea = rowAreas.sum () * band.XSize
+        n = overview.XSize * overview.YSize
+
+        bounds = {}
+        for value, count in counts.items ():
+            p = count / n
+            bounds[value] = self.Z95 * totalArea * math.sqrt (p * (1 - p) / n)
+
+        return areas, bounds
+
+    def estimateFromBlocks (self, band, rowAreas: NPy.ndarray, fraction: float) -> Tuple[Dict, Dict]:
+        ''' estimate areas from a stratified sample of blocks (one random block 
+            per stratum of consecutive blocks); areas use a ratio estimator 
+            against the known total area, bounds its variance, treating the 
+            sample as simple random (conservative for the stratified design) 
+
+            @param band: full resolution band 
+            @param rowAreas: per-row pixel areas (square meters) 
+            @param fraction: fraction of blocks to read 
+            @return: areas and error bounds by value (square meters) '''
+
+        windows = list (RasterUtils.blockWindows (band))
+        nBlocks = len (windows)
+        nSample = min (nBlocks, max (self.MIN_SAMPLE_BLOCKS, int (math.ceil (fraction * nBlocks))))
+
+        rng = random.Random (self.SAMPLE_SEED)
+        edges = NPy.linspace (0, nBlocks, nSample + 1).astype (NPy.int64)
+        picked = [windows[rng.randrange (lo, hi)] for lo, hi in zip (edges[:-1], edges[1:]) if hi > lo]
+
+        blockSums = []
+        blockAreas = NPy.zeros (len (picked))
+
+        for iBlock, (xOff, yOff, xSize, ySize) in enumerate (picked):
+            data = band.ReadAsArray (xOff, yOff, xSize, ySize)
+            weights = rowAreas[yOff:yOff + ySize]
+            blockSums.append (RasterUtils.arrayHistogram (data, weights))
+            blockAreas[iBlock] = weights.sum () * xSize
+
+        totalArea = rowAreas.sum () * band.XSize
+        values = sorted (set ().union (*blockSums))
+        n = len (picked)
+        finite = 1 - n / nBlocks
+
+        areas = {}
+        bounds = {}
+
+        for value in values:
+            y = NPy.array ([sums.get (value, 0.0) for sums in blockSums])
+            ratio = y.sum () / blockAreas.sum ()
+            residuals = y - ratio * blockAreas
+            variance = finite * residuals.var (ddof = 1) / (n * blockAreas.mean () ** 2) if n > 1 else 0.0
+
+            areas[value] = ratio * totalArea
+            bounds[value] = self.Z95 * totalArea * math.sqrt (variance)
+
+        return areas, bounds
@@ -3,40 +3,39 @@
 from typing import Optional
 from typing import Union 
 from typing import Dict
+from typing import List
 from typing import Any 
 
 import sys
+import csv
+import json
+import math
 
-from Reprojector import Reprojector
-from GeoTransform import GeoTransform
+from concurrent.futures import ProcessPoolExecutor
 
-from Utils.UnitUtils import UnitUtils
-from Utils.TmpFileUtils import TmpFileUtils
-
-from osgeo import gdalconst as GConst  
-from osgeo import gdal 
+from AreaCounter import AreaCounter
+from AreaCache import AreaCache
+from FileFingerprint import FileFingerprint
+from HistogramSidecar import HistogramSidecar
+from TempStorage import TempStorage
 
-import numpy as NPy
+from Utils.TmpFileUtils import TmpFileUtils
 
 class BeanCounter:
-    ''' analyzes the effect of filtering on the data ''' 
+    ''' analyzes the effect of filtering on the data; the stages compared
+        and the crop names reported are set by a layout ''' 
 
     WORK_PROJ4      = "+proj=aea +lat_1=29.5 +lat_2=45.5 +lat_0=23 +lon_0=-96 +x_0=0 +y_0=0 +ellps=GRS80 +datum=NAD83 +towgs84=0,0,0,0,0,0,0 +units=m +no_defs"
 
-    INPUTS          = [(RAW      := "raw"),
+    STAGES          = [(RAW      := "raw"),
+                       (CLEAN    := "clean"),
                        (SWEPT    := "swept"),
                        (MERGED   := "merged"),
+                       (MERGED2  := "merged2"),
                        (ADJUSTED := "adjusted"),
                        (PRODUCT  := "product")]
 
-    TOTAL           = "sum"
-    REGION_TOTAL    = "TOTAL"
-
-    TAreaDists = Dict[int, float]
-    TSingleResult = Dict[str, TAreaDists] 
-    TResultDict = Dict[str, TSingleResult]
-
-    CROP_NAMES      = {0 : "NOP",
+    SHORT_NAMES     = {0 : "NOP",
                        1 : "WHT",
                        2 : "CRN",
                        3 : "SYB",
@@ -46,45 +45,205 @@ class BeanCounter:
                        7 : "SGH",
                        8 : "RCE"}
 
-    def __init__ (self, output: str):
+    LONG_NAMES      = {0 : "UCULTIV",
+                       1 : "WHEAT",
+                       2 : "CORN",
+                       3 : "SOYBEAN",
+                       4 : "UCOTTON",
+                       5 : "OTHER",
+                       6 : "PREVENT",
+                       7 : "SORGHUM",
+                       8 : "RICE"}
+
+    LAYOUTS         = [(LAYOUT_FINAL   := "final"),
+                       (LAYOUT_CLEAN   := "clean"),
+                       (LAYOUT_MERGED2 := "merged2")]
+
+    LAYOUT_STAGES   = {LAYOUT_FINAL   : [RAW, SWEPT, MERGED, ADJUSTED, PRODUCT],
+                       LAYOUT_CLEAN   : [RAW, CLEAN, PRODUCT],
+                       LAYOUT_MERGED2 : [RAW, SWEPT, MERGED2, PRODUCT]}
+
+    LAYOUT_NAMES    = {LAYOUT_FINAL   : SHORT_NAMES,
+                       LAYOUT_CLEAN   : LONG_NAMES,
+                       LAYOUT_MERGED2 : SHORT_NAMES}
+
+    # raw data each layout compares against, as the former per-layout 
+    # scripts read it (BeanCounter, BeanCounter2, BeanCounter3)
+    LAYOUT_RAW_FMT  = {LAYOUT_FINAL   : "{ubase}2020_20200807.tif",
+                       LAYOUT_CLEAN   : "{ubase}2020_20200711.tif",
+                       LAYOUT_MERGED2 : "{ubase}2020_20200711.tif"}
+
+    TOTAL           = "sum"
+    REGION_TOTAL    = "TOTAL"
+    BOUND_SUFFIX    = " +/-"
+
+    # text report of each layout, exactly as the former per-layout scripts 
+    # wrote it: area table header and row, percentage table header and row 
+    # (the percentages are preformatted with PERC_FMT)
+    REPORT_FORMATS  = {LAYOUT_FINAL   : ("{region: <8}     RAW         SWEPT       MERGED      ADJUST      PRODUCT     ",
+                                         "         {ctype: <3} {raw: >11.2f} {swept: >11.2f} {merged: >11.2f} {adjusted: >11.2f} {product: >11.2f}",
+                                         "{region: <8}    RAW    SWEPT  MERGED ADJUST PRODUCT",
+                                         "        {ctype: <3} {raw} {swept} {merged} {adjusted} {product}"),
+                       LAYOUT_CLEAN   : ("{region: <6}            RAW         CLEAN       PRODUCT     ",
+                                         "      {code: <2} {ctype: <8} {raw: >11.2f} {clean: >11.2f} {product: >11.2f}",
+                                         "{region: <8}         RAW    CLEAN  PRODUCT",
+                                         "     {code: >2} {ctype: <8} {raw} {clean} {product}"),
+                       LAYOUT_MERGED2 : ("{region: <8}     RAW         SWEPT       MERGED      PRODUCT     ",
+                                         "         {ctype: <3} {raw: >11.2f} {swept: >11.2f} {merged2: >11.2f} {product: >11.2f}",
+                                         "{region: <8}    RAW    SWEPT   MERGED PRODUCT",
+                                         "        {ctype: <3} {raw} {swept} {merged2} {product}")}
+
+    PERC_FMT        = "{0: >6.2f}"
+    PERC_ERROR_FMT  = "{0: >6}"
+
+    TAreaDists = Dict[int, float]
+    TSingleResult = Dict[str, TAreaDists] 
+    TResultDict = Dict[str, TSingleResult]
+
+    def __init__ (self, output: str, 
+                        cache: Optional[str] = None,
+                        approximate: Optional[str] = None,
+                        layout: str = LAYOUT_FINAL):
         ''' initializer 
         
-            @param output: where to write the results ''' 
+            @param output: where to write the text report 
+            @param cache: if not None, file with cached area distributions 
+            @param approximate: if not None, estimate areas of rasters without 
+                                sidecar or cache entry (see AreaCounter.ESTIMATES) 
+            @param layout: stages and crop names to report, one of LAYOUTS ''' 
+
+        if layout not in self.LAYOUTS:
+            raise ValueError (f"Unknown report layout '{layout}'")
 
         self.Results: Dict[Any, Any] = {} # TResultDict
+        self.Bounds: Dict[Any, Any] = {}  # TResultDict, error bounds of the estimates
+        self.Approximate = approximate
+        self.Layout = layout
+        self.Inputs = self.LAYOUT_STAGES[layout]
+        self.CropNames = self.LAYOUT_NAMES[layout]
         self.Output = output
-        
-        if os.path.exists (self.Output):
-            os.unlink (self.Output)
+        self.AreaCounter = AreaCounter (self.WORK_PROJ4)
+        self.Cache = AreaCache (cache) if cache is not None else None
+
+    @classmethod
+    def rawFile (clss, layout: str, region: str) -> str:
+        ''' name of the raw data file of a region 
+
+            @param layout: report layout, one of LAYOUTS 
+            @param region: region (product subdirectory) name 
+            @return: file name, relative to the data path '''
 
-    def analyze (self, *, region: str,
-                          raw: str,
-                          swept: str,
-                          merged: str,
-                          adjusted: str,
-                          product: str):
+        return clss.LAYOUT_RAW_FMT[layout].format (ubase = region.upper ())
 
-        ''' analyzes a single run, making comparison between  the following files:
+    def analyze (self, region: str, **files: str):
+        ''' analyzes a single run, comparing the files of all stages of the layout
         
             @param region: region name for identification 
-            @param raw: initial data with no cleanup applied 
-            @param swept: data after application of the MCQ filter 
-            @param merged: data after application CLU aggregator and MCQ, merged 
-            @param adjusted: data with uncultivated pixels forced 
-            @param product: final data, after reprojection '''
+            @param files: file of each stage, by stage name (e.g. raw = ..., product = ...) '''
+
+        missing = [part for part in self.Inputs if part not in files]
+        if missing:
+            raise ValueError (f"No file for stage(s) {', '.join (missing)} of region {region}")
 
         areaDist: Dict[Any, Any] = {} # TSingleResult
-        
-        inputFiles = {self.RAW      : raw,
-                      self.SWEPT    : swept,
-                      self.MERGED   : merged,
-                      self.ADJUSTED : adjusted,
-                      self.PRODUCT  : product}
+        boundDist: Dict[Any, Any] = {} # TSingleResult
 
-        for part in self.INPUTS:
-            areaDist[part] = self.calculateAreaDists (inputFiles[part])
+        for part in self.Inputs:
+            areas, noDataValue, bounds = self.measure (files[part])
+            areaDist[part] = self.selectCrops (areas, noDataValue)
+            boundDist[part] = self.selectCrops (bounds or {}, noDataValue)
 
         self.Results[region] = areaDist
+        self.Bounds[region] = boundDist
+
+        if self.Cache is not None:
+            self.Cache.save ()
+
+    def analyzeMany (self, runs: Dict[str, Dict[str, str]], workers: Optional[int] = None):
+        ''' analyzes many runs at once; every (region, stage) file is an 
+            independent job for a pool of worker processes, results are 
+            recorded in the order of the runs 
+
+            @param runs: {region : {stage : file}} with a file for each stage of the layout 
+            @param workers: number of worker processes (None for one per CPU) '''
+
+        measured = {}
+        digests = {}
+
+        with ProcessPoolExecutor (max_workers = workers,
+                                  initializer = TempStorage.attach,
+                                  initargs = (TempStorage.RamDir, TempStorage.Budget)) as executor:
+            jobs = {}
+
+            for files in runs.values ():
+                for part in self.Inputs:
+                    filename = files[part]
+                    if filename not in measured and filename not in jobs:
+                        if (known := self.lookup (filename)) is not None:
+                            measured[filename] = (*known, None)
+                        elif self.Approximate is not None:
+                            jobs[filename] = executor.submit (self.AreaCounter.estimate, 
+                                                              filename, self.Approximate)
+                        else:
+                            jobs[filename] = executor.submit (self.AreaCounter.calculate, filename)
+                            if self.Cache is not None:
+                                digests[filename] = executor.submit (FileFingerprint.digest, filename)
+
+            for filename, job in jobs.items ():
+                if self.Approximate is not None:
+                    areas, bounds, noDataValue = job.result ()
+                    measured[filename] = areas, noDataValue, bounds
+                else:
+                    areas, noDataValue = job.result ()
+                    measured[filename] = areas, noDataValue, None
+                    digest = digests[filename].result () if filename in digests else None
+                    self.remember (filename, areas, noDataValue, digest = digest)
+
+        for region, files in runs.items ():
+            self.Results[region] = {}
+            self.Bounds[region] = {}
+
+            for part in self.Inputs:
+                areas, noDataValue, bounds = measured[files[part]]
+                self.Results[region][part] = self.selectCrops (areas, noDataValue)
+                self.Bounds[region][part] = self.selectCrops (bounds or {}, noDataValue)
+
+        if self.Cache is not None:
+            self.Cache.save ()
+
+    def lookup (self, filename: str):
+        ''' find valid areas of a file without reading it, either from the 
+            histogram sidecar written with the file or from the cache 
+
+            @param filename: file to look for 
+            @return: (areas, no-data value) or None '''
+
+        result = None
+
+        if (sidecar := HistogramSidecar.read (filename)) is not None:
+            summary, noDataValue = sidecar
+            result = self.AreaCounter.toAcres (summary, noDataValue), noDataValue
+
+        elif self.Cache is not None:
+            result = self.Cache.lookup (filename, self.AreaCounter.parameters ())
+
+        return result 
+
+    def remember (self, filename: str, 
+                        areas: Dict[Any, float], 
+                        noDataValue: Any,
+                        digest: Optional[str] = None):
+
+        ''' store freshly computed areas of a file in the cache 
+
+            @param filename: analyzed file 
+            @param areas: areas by pixel value 
+            @param noDataValue: no-data value of the file 
+            @param digest: content hash of the file, if already known '''
+
+        if self.Cache is not None:
+            self.Cache.store (filename, self.AreaCounter.parameters (), 
+                              areas, noDataValue, digest)
 
     def calculateAreaDists (self, filename: str) -> TAreaDists:
         ''' calculate area distributions by crop type 
@@ -92,78 +251,149 @@ class BeanCounter:
             @param filename: file to analyze 
             @return: area distributions '''
 
-        result: Dict[Any, Any] = {} # TAReaDists 
+        areas, noDataValue, _bounds = self.measure (filename)
+
+        return self.selectCrops (areas, noDataValue)
+
+    def measure (self, filename: str):
+        ''' find areas of all values in a file, from its sidecar, the cache, 
+            an estimate (in approximate mode) or a full count 
+
+            @param filename: file to analyze 
+            @return: areas, no-data value and error bounds (None if exact) '''
+
+        if (known := self.lookup (filename)) is not None:
+            result = (*known, None)
+
+        elif self.Approximate is not None:
+            areas, bounds, noDataValue = self.AreaCounter.estimate (filename, self.Approximate)
+            result = areas, noDataValue, bounds
 
-        if (prj := Reprojector.p4Projection (filename)) != self.WORK_PROJ4:
-            workmap = TmpFileUtils.newTmp (filename)
-            Reprojector ().warpRaster (filename, workmap, self.WORK_PROJ4)
         else:
-            workmap = filename
+            areas, noDataValue = self.AreaCounter.calculate (filename)
+            self.remember (filename, areas, noDataValue)
+            result = areas, noDataValue, None
+
+        return result 
 
-        ds = gdal.Open (workmap, GConst.GA_ReadOnly)
-        band = ds.GetRasterBand (1)
-        noDataValue = band.GetNoDataValue ()
-        data = band.ReadAsArray ()
+    def selectCrops (self, areas: Dict[Any, float], noDataValue: Any) -> TAreaDists:
+        ''' pick the areas of known crop types 
 
-        gtrans = GeoTransform (dataset = ds)
-        pixelArea = gtrans.getPixelArea ()
-        pixelArea = UnitUtils.acres (meters = pixelArea) 
+            @param areas: areas by pixel value 
+            @param noDataValue: no-data value (never reported) 
+            @return: area distributions '''
 
-        crops = self.CROP_NAMES.keys ()
+        result: Dict[Any, Any] = {} # TAReaDists 
+
+        crops = self.CropNames.keys ()
         minCrop = min (crops)
         maxCrop = max (crops)
 
         for crop in range (minCrop, maxCrop + 1):
             if crop != noDataValue:
-                result[crop] = NPy.count_nonzero ((data == crop)) * pixelArea        
-
-        # types, counts = NPy.unique (data, return_counts = True)
-        # nTypes = len (types)
-
-        # for iType in range (nTypes):
-        #     if noDataValue is None or iType != noDataValue:
-        #         result[iType] = counts[iType] * pixelArea
-
-        ds = None 
-        if workmap != filename:
-            os.unlink (workmap)
+                result[crop] = areas.get (crop, 0)
 
         return result 
 
     def report (self):
-        ''' print the report of all recorded results ''' 
+        ''' write the text report of all recorded results, in a single write ''' 
 
-        self.homogenizeReports ()
-        self.summarizeReports ()
+        self.tabulate ()
+
+        lines: List[str] = []
 
         for region in self.Results:
-            result = self.Results[region]
-            self.reportAreas (result, region)
+            lines += self.renderAreas (self.Results[region], region)
 
-        self.reportAreas (self.Summaries, self.REGION_TOTAL)
+        lines += self.renderAreas (self.Summaries, self.REGION_TOTAL)
 
         for region in self.Results:
-            result = self.Results[region] 
-            self.reportPercentages (result, region)
+            lines += self.renderPercentages (self.Results[region], region)
+
+        lines += self.renderPercentages (self.Summaries, self.REGION_TOTAL)
+
+        if self.Approximate is not None:
+            for region in self.Bounds:
+                lines += self.renderAreas (self.Bounds[region], region + self.BOUND_SUFFIX)
+
+            lines += self.renderAreas (self.BoundSummaries, self.REGION_TOTAL + self.BOUND_SUFFIX)
+
+        with open (self.Output, "w") as outf:
+            outf.write ("".join (lines))
+
+    def writeCSV (self, filename: str):
+        ''' write all recorded results as CSV, one row per region, stage and crop 
+
+            @param filename: output file '''
+
+        self.tabulate ()
+
+        regions = dict (self.Results)
+        regions[self.REGION_TOTAL] = self.Summaries
+        bounds = dict (self.Bounds)
+        bounds[self.REGION_TOTAL] = self.BoundSummaries
+
+        with open (filename, "w", newline = "") as outf:
+            writer = csv.writer (outf)
+            writer.writerow (["region", "stage", "code", "crop", "acres", "percent", "bound"])
+
+            for region, result in regions.items ():
+                for part in self.Inputs:
+                    for rk in self.AllKeys:
+                        percent = self.perc (result[part][rk], result[self.Inputs[0]][rk])
+                        writer.writerow ([region, part, rk, self.CropNames[rk],
+                                          f"{result[part][rk]:.2f}",
+                                          f"{percent:.2f}" if percent is not None else "",
+                                          f"{bounds[region][part][rk]:.2f}"])
+
+    def writeJSON (self, filename: str):
+        ''' write all recorded results as JSON 
+
+            @param filename: output file '''
+
+        self.tabulate ()
+
+        document = {"layout"  : self.Layout,
+                    "stages"  : self.Inputs,
+                    "crops"   : {str (rk) : self.CropNames[rk] for rk in self.AllKeys},
+                    "exact"   : self.Approximate is None,
+                    "regions" : self.Results,
+                    "total"   : self.Summaries,
+                    "bounds"  : self.Bounds,
+                    "totalBounds" : self.BoundSummaries}
+
+        with open (filename, "w") as outf:
+            json.dump (document, outf, indent = 1)
+
+    def tabulate (self):
+        ''' complete the recorded results and calculate the summaries '''
 
-        self.reportPercentages (self.Summaries, self.REGION_TOTAL)
+        self.homogenizeReports ()
+        self.summarizeReports ()
 
     def summarizeReports (self):
-        ''' calculate the summary reports ''' 
+        ''' calculate the summary reports; regional error bounds are combined 
+            as independent errors ''' 
 
         self.Summaries = {}
+        self.BoundSummaries = {}
 
-        for reportType in self.INPUTS:
+        for reportType in self.Inputs:
             self.Summaries[reportType] = {}
+            self.BoundSummaries[reportType] = {}
 
             for key in self.AllKeys:
                 self.Summaries[reportType][key] = 0
+                squares = 0.0
                     
                 for region in self.Results:
                     self.Summaries[reportType][key] += self.Results[region][reportType][key]
+                    squares += self.Bounds[region][reportType][key] ** 2
+
+                self.BoundSummaries[reportType][key] = math.sqrt (squares)
 
     def homogenizeReports (self):
-        ''' prepare summary report and add it to the results '''
+        ''' make all results (and their bounds) report the same crop types '''
 
         self.AllKeys = []
 
@@ -177,56 +407,37 @@ class BeanCounter:
                     if cropType not in self.AllKeys:
                         self.AllKeys.append (cropType)
 
-        for region in self.Results:
-            regionData = self.Results[region]
+        self.AllKeys.sort ()
 
-            for reportType in regionData:
-                data = regionData[reportType]
+        for results in (self.Results, self.Bounds):
+            for region in results:
+                regionData = results[region]
+
+                for reportType in regionData:
+                    data = regionData[reportType]
 
-                for cropType in self.AllKeys:
-                    if cropType not in data:
-                        data[cropType] = 0
+                    for cropType in self.AllKeys:
+                        if cropType not in data:
+                            data[cropType] = 0
 
-    def reportPercentages (self, result: TSingleResult, region: str):
+    def renderPercentages (self, result: TSingleResult, region: str) -> List[str]:
         ''' make the report but use percentages against raw data 
 
             @param result: result to report 
-            @param region: region identifier '''
-
-        outf = open (self.Output, "a")
-    
-        HEADER_FMT  = "{region: <8}    RAW    SWEPT  MERGED ADJUST PRODUCT"
-        DATA_FMT    = "        {ctype: <3} {raw: >6.2f} {swept: >6.2f} {merged: >6.2f} {adjusted: >6.2f} {product: >6.2f}\n" 
-        SINGLE_FMT  = "{0: >6.2f}"
-        ERROR_FMT   = "{0: >6}"
-        DATAROW_FMT = "        {ctype: <3} {raw} {swept} {merged} {adjusted} {product}\n"
-        
-        header = HEADER_FMT.format (region = region)
-        uline = "-" * len (header)
-        header = "\n".join ((uline, header, uline)) + "\n"
-        outf.write (header)
-
-        for rk in self.AllKeys:
-            base = result[self.RAW][rk]
+            @param region: region identifier 
+            @return: lines of the table '''
 
-            fmtf = lambda x: SINGLE_FMT.format (x) if x is not None else ERROR_FMT.format ("!!!")
+        _areaHeader, _areaRow, header, row = self.REPORT_FORMATS[self.Layout]
+        base = self.Inputs[0]
 
-            rawp = fmtf (self.perc (result[self.RAW][rk], base))
-            sweptp = fmtf (self.perc (result[self.SWEPT][rk], base))
-            mergedp = fmtf (self.perc (result[self.MERGED][rk], base))
-            productp = fmtf (self.perc (result[self.PRODUCT][rk], base))
-            adjustedp = fmtf (self.perc (result[self.ADJUSTED][rk], base))
+        fmtf = lambda x: self.PERC_FMT.format (x) if x is not None else self.PERC_ERROR_FMT.format ("!!!")
 
-            datarow = DATAROW_FMT.format (ctype = self.CROP_NAMES[rk],
-                                          raw = rawp,
-                                          swept = sweptp,
-                                          merged = mergedp,
-                                          adjusted = adjustedp,
-                                          product = productp)
-            outf.write (datarow)
+        rows = [row.format (ctype = self.CropNames[rk], code = rk,
+                            **{part : fmtf (self.perc (result[part][rk], result[base][rk])) 
+                               for part in self.Inputs})
+                for rk in self.AllKeys]
 
-        outf.write ('\n')
-        outf.close ()
+        return self.renderTable (header.format (region = region), rows)
 
     def perc (self, value: float, base: float) -> Union[None, float]:
         ''' calculate percentage vs. given base 
@@ -245,33 +456,31 @@ class BeanCounter:
 
         return result 
 
-    def reportAreas (self, result: TSingleResult, region: str):
-        ''' print the area report for single result 
+    def renderAreas (self, result: TSingleResult, region: str) -> List[str]:
+        ''' make the area report for single result 
         
             @param result: result data 
-            @param region: region where the data were calculated ''' 
+            @param region: region where the data were calculated 
+            @return: lines of the table ''' 
 
-        outf = open (self.Output, "a")
+        header, row, _percHeader, _percRow = self.REPORT_FORMATS[self.Layout]
 
-        HEADER_FMT = "{region: <8}     RAW         SWEPT       MERGED      ADJUST      PRODUCT     "
-        DATA_FMT   = "         {ctype: <3} {raw: >11.2f} {swept: >11.2f} {merged: >11.2f} {adjusted: >11.2f} {product: >11.2f}\n"
-        
-        header = HEADER_FMT.format (region = region)
-        uline = "-" * len (header)
-        header = "\n".join ((uline, header, uline)) + "\n"
-        outf.write (header)
+        rows = [row.format (ctype = self.CropNames[rk], code = rk,
+                            **{part : result[part][rk] for part in self.Inputs})
+                for rk in self.AllKeys]
+
+        return self.renderTable (header.format (region = region), rows)
+
+    def renderTable (self, header: str, rows: List[str]) -> List[str]:
+        ''' frame a table with its underlined header 
+
+            @param header: header line 
+            @param rows: data rows 
+            @return: lines of the table, ending with an empty line '''
 
-        for rk in self.AllKeys:
-            datarow = DATA_FMT.format (ctype = self.CROP_NAMES[rk],
-                                       raw = result[self.RAW][rk],
-                                       swept = result[self.SWEPT][rk],
-                                       merged = result[self.MERGED][rk],
-                                       adjusted = result[self.ADJUSTED][rk],
-                                       product = result[self.PRODUCT][rk])
-            outf.write (datarow)
+        uline = "-" * len (header)
 
-        outf.write ("\n")
-        outf.close ()
+        return [uline + "\n", header + "\n", uline + "\n"] + [row + "\n" for row in rows] + ["\n"]
 
 # ..................................... MAIN ................................
 
@@ -280,17 +489,32 @@ import os
 if __name__ == "__main__":
 
     REQUIRED_ARGS = 3
+    OPTIONAL_ARGS = 3
+
+    EXACT = "exact"
 
     args = sys.argv[1:]
     nArgs = len (args)
 
-    if nArgs == REQUIRED_ARGS:
-        RAW_DATA_FMT = "{ubase}2020_20200807.tif"
+    if REQUIRED_ARGS <= nArgs <= REQUIRED_ARGS + OPTIONAL_ARGS:
         BASE_DATA_FMT = "{lbase}.tif"
+        CACHE_FMT = "{output}.cache.json"
+        TABLE_FMT = "{root}.{ext}"
+        TMP_PREFIX = "beancounter"
 
         with TmpFileUtils () as _tmpfu:
-            dataPath, productPath, output = sys.argv[1:]
-            bc = BeanCounter (output)   
+            dataPath, productPath, output = args[:REQUIRED_ARGS]
+            workers = int (args[REQUIRED_ARGS]) if nArgs > REQUIRED_ARGS else None
+            method = args[REQUIRED_ARGS + 1] if nArgs > REQUIRED_ARGS + 1 else EXACT
+            layout = args[REQUIRED_ARGS + 2] if nArgs > REQUIRED_ARGS + 2 else BeanCounter.LAYOUT_FINAL
+
+            TempStorage.init (TMP_PREFIX, shares = workers or os.cpu_count () or 1)
+
+            bc = BeanCounter (output, 
+                              cache = CACHE_FMT.format (output = output),
+                              approximate = None if method == EXACT else method,
+                              layout = layout)
+            runs = {}
 
             subdirs = sorted (os.listdir (productPath))
             for sd in subdirs[:]:
@@ -299,21 +523,25 @@ if __name__ == "__main__":
 
                 base = os.path.basename (sd)
                 lbase = base.lower ()
-                ubase = base.upper ()
-                raw = RAW_DATA_FMT.format (ubase = ubase)
+                raw = BeanCounter.rawFile (layout, base)
                 dtf = BASE_DATA_FMT.format (lbase = lbase)
 
                 pDir = os.path.join (productPath, sd)
 
-                bc.analyze (region = base, 
-                            raw = os.path.join (dataPath, raw),
-                            swept = os.path.join (pDir, BeanCounter.SWEPT, dtf),
-                            merged = os.path.join (pDir, BeanCounter.MERGED, dtf),
-                            adjusted = os.path.join (pDir, BeanCounter.ADJUSTED, dtf),
-                            product = os.path.join (pDir, BeanCounter.PRODUCT, dtf))
+                runs[base] = {part : os.path.join (pDir, part, dtf) for part in bc.Inputs}
+                runs[base][BeanCounter.RAW] = os.path.join (dataPath, raw)
+
+            if workers == 1:
+                for region, files in runs.items ():
+                    bc.analyze (region, **files)
+            else:
+                bc.analyzeMany (runs, workers)
 
+            root = os.path.splitext (output)[0]
             bc.report ()
+            bc.writeCSV (TABLE_FMT.format (root = root, ext = "csv"))
+            bc.writeJSON (TABLE_FMT.format (root = root, ext = "json"))
 
     else:
         app = os.path.basename (sys.argv[0])
-        sys.stderr.write (f"\nUSAGE: [python3] {app} datapath productdir\n\n")      
\ No newline at end of file
+        sys.stderr.write (f"\nUSAGE: [python3] {app} datapath productdir output [workers [exact|overview|sample [final|clean|merged2]]]\n\n")
@@ -0,0 +1,92 @@
+from typing import Union
+
+import numpy as NPy
+
+class BlockReducer:
+    ''' vectorized integer-factor downsampling of categorical rasters; each
+        factor x factor block of source pixels becomes one output pixel '''
+
+    REDUCERS                = [(NEAREST := "near"),
+                               (MODE    := "mode")]
+
+    def __init__ (self, factor: int,
+                        method: str = NEAREST,
+                        noDataValue: Union[int, float, None] = None):
+
+        ''' initializer
+
+            @param factor: integer downsampling factor (same in X and Y)
+            @param method: reduction method, one of REDUCERS
+            @param noDataValue: no-data value ignored by the mode reducer '''
+
+        if method not in self.REDUCERS:
+            raise ValueError (f"Unknown reduction method '{method}'")
+
+        self.Factor = factor
+        self.Method = method
+        self.NoDataValue = noDataValue
+
+    def reduce (self, data: NPy.ndarray) -> NPy.ndarray:
+        ''' reduce a strip of data; both dimensions must be divisible by
+            the factor
+
+            @param data: 2D array of source pixels
+            @return: 2D array of reduced pixels '''
+
+        if self.Method == self.NEAREST:
+            result = self.nearest (data)
+        else:
+            result = self.mode (data)
+
+        return result
+
+    def nearest (self, data: NPy.ndarray) -> NPy.ndarray:
+        ''' pick the pixel under the center of each block, which is the same
+            pixel gdalwarp -r near samples for an aligned integer factor
+
+            @param data: 2D array of source pixels
+            @return: 2D array of reduced pixels '''
+
+        offset = self.Factor // 2
+
+        return NPy.ascontiguousarray (data[offset::self.Factor, offset::self.Factor])
+
+    def mode (self, data: NPy.ndarray) -> NPy.ndarray:
+        ''' pick the most frequent value of each block (ties go to the lower
+            value, no-data only wins when the block holds nothing else); the 
+            distinct values of the strip are counted one at a time against a 
+            running maximum, so besides the strip only per-block vectors and 
+            one boolean mask of the strip are held
+
+            @param data: 2D array of integer source pixels
+            @return: 2D array of reduced pixels '''
+
+        f = self.Factor
+        rows = data.shape[0] // f
+        cols = data.shape[1] // f
+
+        blocks = data.reshape (rows, f, cols, f).swapaxes (1, 2).reshape (-1, f * f)
+
+        result = NPy.zeros (blocks.shape[0], dtype = data.dtype)
+        best = NPy.zeros (blocks.shape[0], dtype = NPy.int32)
+        hasNoData = False
+
+        for value in NPy.unique (blocks):      # ascending, so ties keep the lower value
+            if self.isNoData (value):
+                hasNoData = True
+                continue
+
+            counts = NPy.count_nonzero (blocks == value, axis = 1)
+            better = counts > best
+            best[better] = counts[better]
+            result[better] = value
+
+        if hasNoData:
+            result[best == 0] = self.NoDataValue
+
+        return result.reshape (rows, cols)
+
+    def isNoData (self, value) -> bool:
+        ''' check whether a pixel value is the no-data value '''
+
+        return self.NoDataValue is not None and value == self.NoDataValue
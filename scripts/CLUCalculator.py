@@ -11,8 +11,13 @@ import datetime
 
 from scipy import stats
 
+import numpy as NPy
+
 from GeoTransform import GeoTransform
 from CLUIdentifier import CLUIdentifier
+from VectorStream import VectorStream
+from VectorFormat import VectorFormat
+from CLUIndex import CLUIndex
 
 from collections import namedtuple
 
@@ -27,16 +32,20 @@ class CLUCalculator:
     MAJORITY_CROP_FIELD         = "MajorCrop"
     COVERAGE_FIELD              = "Coverage"
     
-    def __init__ (self, items2process, outpath, verbose = False, limit = None):
+    def __init__ (self, items2process, outpath, verbose = False, limit = None, window = None):
         ''' constructor 
         
             @param items2process: all items to process as (map, clu) pairs 
-            @param outpath: path where results will be saved '''
+            @param outpath: path where results will be saved 
+            @param window: if not None, only process CLUs intersecting this 
+                           (west, south, east, north) window, found through 
+                           the CLUIndex of the CLU file '''
         
         self.Items = items2process
         self.OutputPath = outpath
         self.Verbose = verbose
         self.Limit = limit
+        self.Window = window
         
         if os.path.exists (self.OutputPath):
             shutil.rmtree (self.OutputPath)
@@ -54,39 +63,69 @@ class CLUCalculator:
             @param band: raster band with data 
             @return: 2D array of pixel data '''
         
-        limX = band.XSize - 1 
-        limY = band.YSize - 1
-        
-        pxS = transform.lat2row (south)
-        pxN = transform.lat2row (north)
-        pxW = transform.lon2col (west)
-        pxE = transform.lon2col (east)
-        
-        if pxS != int (pxS): pxS += 1   # include partial pixels 
-        if pxE != int (pxE): pxE += 1
-        
-        pxS = int (pxS)
-        pxN = int (pxN)
-        pxW = int (pxW)
-        pxE = int (pxE)
-        
-        if pxN < 0: pxN = 0             # limit data cutout to within the image
-        if pxS > limY: pxS = limY
-        if pxW < 0: pxW = 0
-        if pxE > limX: pxE = limX
-        
-        dataWidth = pxE - pxW + 1
-        dataHeight = pxS - pxN + 1 
+        windows, valid = transform.pixelWindows ([(west, east, south, north)], 
+                                                 band.XSize, band.YSize)
         
-        if dataWidth < 0 or dataHeight < 0:
-            result = None
-        else:
-            result = band.ReadAsArray (pxW, pxN, dataWidth, dataHeight)
+        return self.readWindow (band, windows[0], valid[0])
+
+    def readWindow (self, band, window, valid):
+        ''' read a pixel window from a raster band 
+
+            @param band: raster band with data 
+            @param window: (xoff, yoff, xsize, ysize) window 
+            @param valid: False if the window is empty 
+            @return: 2D array of pixel data or None '''
+
+        result = None
+
+        if valid:
+            xOff, yOff, xSize, ySize = window.tolist ()
+            result = band.ReadAsArray (xOff, yOff, xSize, ySize)
 
         return result
         
+    def readEnvelopes (self, layer):
+        ''' collect envelopes and IDs of all polygon CLUs of a layer, in bulk 
+
+            @param layer: CLU layer 
+            @return: N x 4 array of (west, east, south, north) envelopes and 
+                     the list of CLU IDs, in layer order '''
+
+        columns = VectorStream (layer, fields = [CLUIdentifier.ID_FIELD]).readAll (self.Limit)
+
+        gTypes = columns[VectorStream.GEOMETRY_TYPE]
+        polygons = (gTypes == ogr.wkbPolygon) | (gTypes == ogr.wkbMultiPolygon)
+
+        return columns[VectorStream.ENVELOPE][polygons], \
+               columns[CLUIdentifier.ID_FIELD][polygons].tolist ()
+
+    def readWindowEnvelopes (self, clulist, layer):
+        ''' collect envelopes and IDs of the polygon CLUs intersecting the 
+            window, using the spatial index of the CLU file 
+
+            @param clulist: CLU file 
+            @param layer: its CLU layer 
+            @return: N x 4 array of (west, east, south, north) envelopes and 
+                     the list of CLU IDs, in FID order '''
+
+        index = CLUIndex (clulist).load ()
+        positions = index.query (self.Window)
+        positions = positions[NPy.argsort (index.FIDs[positions], kind = "stable")]
+
+        gTypes = index.Types[positions]
+        positions = positions[(gTypes == ogr.wkbPolygon) | (gTypes == ogr.wkbMultiPolygon)]
+        if self.Limit is not None:
+            positions = positions[:self.Limit]
+
+        idFieldIndex = layer.FindFieldIndex (CLUIdentifier.ID_FIELD, True)
+        cluIDs = [layer.GetFeature (fid).GetField (idFieldIndex) 
+                  for fid in index.FIDs[positions].tolist ()]
+
+        return index.envelopes (positions), cluIDs
+
     def process1 (self, datamap, clulist, clumap):
-        ''' process one pixelmap against one CLU list 
+        ''' process one pixelmap against one CLU list; pixel windows of all 
+            CLUs are computed in one go before the rasters are read 
         
             @param datamap: pixel map of data 
             @param clulist: list of CLUs
@@ -109,54 +148,47 @@ class CLUCalculator:
         ResultRecord = namedtuple ("ResultRecord", "majorityCrop fieldCoverage")
         result = {}
         
-        iCLU = 0
-        
         cluVectorLayer = cluListing.GetLayer ()
-        nCLUs = cluVectorLayer.GetFeatureCount ()
-        for clu in cluVectorLayer:
-            geom = clu.GetGeometryRef ()
-            
-            iCLU += 1
-            if iCLU % 1000 == 0:
-                txt = "{0} -> {1: >8} of {2: >8}\n".format (state, iCLU, nCLUs)
+        if self.Window is None:
+            envelopes, cluIDs = self.readEnvelopes (cluVectorLayer)
+        else:
+            envelopes, cluIDs = self.readWindowEnvelopes (clulist, cluVectorLayer)
+        nCLUs = len (cluIDs)
+
+        cluWindows, cluValid = cluGeoTransform.pixelWindows (envelopes, cluBand.XSize, cluBand.YSize)
+        datWindows, datValid = datGeoTransform.pixelWindows (envelopes, datBand.XSize, datBand.YSize)
+
+        for iCLU in range (nCLUs):
+            if (iCLU + 1) % 1000 == 0:
+                txt = "{0} -> {1: >8} of {2: >8}\n".format (state, iCLU + 1, nCLUs)
                 sys.stdout.write (txt)
 
-            if self.Limit is not None and iCLU > self.Limit:
-                break
+            fieldCoverage = None 
+            majorityCrop = None
+            cluID = None
             
-            if geom is not None:
-                gType = geom.GetGeometryType ()
-                
-                fieldCoverage = None 
-                majorityCrop = None
-                cluID = None
+            cluData = self.readWindow (cluBand, cluWindows[iCLU], cluValid[iCLU])
+            mapData = self.readWindow (datBand, datWindows[iCLU], datValid[iCLU])
+            
+            if cluData is not None and mapData is not None:
+                cluID = cluIDs[iCLU]
+                cluPixels = cluData[cluData == cluID].size 
                 
-                if gType == ogr.wkbPolygon or gType == ogr.wkbMultiPolygon:
-                    envelope = geom.GetEnvelope ()
-                    w, e, s, n = envelope 
-                    
-                    cluData = self.getPixelData (s, w, n, e, cluGeoTransform, cluBand)
-                    mapData = self.getPixelData (s, w, n, e, datGeoTransform, datBand)
+                if cluPixels > 0:
+                    validData = mapData[cluData == cluID]
+#                     validData = validData[validData != self.NO_CROP]
+                    validPixels = validData.size 
                     
-                    if cluData is not None and mapData is not None:
-                        cluID = clu.GetField (CLUIdentifier.ID_FIELD)
-                        cluPixels = cluData[cluData == cluID].size 
+                    if validPixels > 0:
+                        fieldCoverage = validPixels / cluPixels * 100. 
+                        majorityCrop = stats.mode (validData).mode[0]
                         
-                        if cluPixels > 0:
-                            validData = mapData[cluData == cluID]
-#                             validData = validData[validData != self.NO_CROP]
-                            validPixels = validData.size 
-                            
-                            if validPixels > 0:
-                                fieldCoverage = validPixels / cluPixels * 100. 
-                                majorityCrop = stats.mode (validData).mode[0]
-                                
-                    if fieldCoverage is None: fieldCoverage = self.NO_COVERAGE
-                    if majorityCrop is None: majorityCrop = self.NO_CROP
-                    
-                    if cluID is not None:                        
-                        result[cluID] = ResultRecord (majorityCrop = majorityCrop,
-                                                      fieldCoverage = fieldCoverage)
+            if fieldCoverage is None: fieldCoverage = self.NO_COVERAGE
+            if majorityCrop is None: majorityCrop = self.NO_CROP
+            
+            if cluID is not None:                        
+                result[cluID] = ResultRecord (majorityCrop = majorityCrop,
+                                              fieldCoverage = fieldCoverage)
                     
         return result 
                     
@@ -178,25 +210,13 @@ class CLUCalculator:
         return fieldIndex 
         
     def copyShapefile (self, source, destination):
-        ''' make a copy of a shapefile with all its components 
+        ''' make a copy of a CLU file with all its components (any of the 
+            VectorFormat formats; the name is kept for existing callers) 
         
-            @param source: shapefile to copy (named by one of its components)
+            @param source: file to copy (named by one of its components)
             @param destination: name for the copy '''
         
-        COMPONENTS = ['shx', 'shp', 'dbf', 'prj']
-                
-        targetPath = os.path.dirname (destination)
-        targetBaseName = os.path.basename (destination)
-        targetRoot, _extension = os.path.splitext (targetBaseName)
-        
-        for cmp in COMPONENTS:
-            sourceFile, _extension = os.path.splitext (source)
-            sourceFile = ".".join ([sourceFile, cmp])
-            
-            targetFile = ".".join ([targetRoot, cmp])
-            target = os.path.join (targetPath, targetFile)
-            
-            shutil.copy (sourceFile, target)
+        VectorFormat.copy (source, destination)
              
     def writeResults (self, clulist, results):
         ''' create a copy of the CLU list and add the results to it 
@@ -211,32 +231,31 @@ class CLUCalculator:
         outputName = os.path.join (self.OutputPath, basename)
         self.copyShapefile (clulist, outputName)
         
-        dataset = ogr.Open (outputName, GC.GA_Update)
-        layer = dataset.GetLayer ()
-        
-        idFieldIndex = layer.FindFieldIndex (CLUIdentifier.ID_FIELD, True)
+        with VectorFormat.openForUpdate (outputName) as (_dataset, layer):
+            majorityFieldIndex = self.createField (self.MAJORITY_CROP_FIELD, 
+                                                   ogr.OFTInteger, 
+                                                   layer)
         
-        majorityFieldIndex = self.createField (self.MAJORITY_CROP_FIELD, 
-                                               ogr.OFTInteger, 
-                                               layer)
+            coverageFieldIndex = self.createField (self.COVERAGE_FIELD, 
+                                                   ogr.OFTReal, 
+                                                   layer)
         
-        coverageFieldIndex = self.createField (self.COVERAGE_FIELD, 
-                                               ogr.OFTReal, 
-                                               layer)
-        
-        for feature in layer: 
-            fieldID = feature.GetField (idFieldIndex)
-            
-            if fieldID in results:
-                try:
+            columns = VectorStream (layer, fields = [CLUIdentifier.ID_FIELD], geometry = False).readAll ()
+            fids = []
+            majorities = []
+            coverages = []
+
+            for fid, fieldID in zip (columns[VectorStream.FID].tolist (), 
+                                     columns[CLUIdentifier.ID_FIELD].tolist ()):
+                if fieldID in results:
                     r = results[fieldID]
-                    feature.SetField (majorityFieldIndex, int (r.majorityCrop))
-                    feature.SetField (coverageFieldIndex, float (r.fieldCoverage))
-                    layer.SetFeature (feature)
-                except NotImplementedError:
-                    pass
-            
-        dataset = None 
+                    fids.append (fid)
+                    majorities.append (int (r.majorityCrop))
+                    coverages.append (float (r.fieldCoverage))
+
+            VectorStream.updateFields (layer, NPy.array (fids, dtype = NPy.int64),
+                                       {majorityFieldIndex : NPy.array (majorities, dtype = NPy.int64),
+                                        coverageFieldIndex : NPy.array (coverages)})
         
     def allDataExist (self, item):
         ''' check if all necessary data exist 
@@ -6,6 +6,11 @@ from osgeo import gdalconst as GC
 import sys
 import os 
 
+import numpy as NPy
+
+from VectorStream import VectorStream
+from VectorFormat import VectorFormat
+
 class CLUIdentifier:
     ''' adds a unique ID to each CLU in the collection of CLUs '''
 
@@ -71,28 +76,25 @@ class CLUIdentifier:
         
             @param filename: file to process '''
                 
-        dataset = ogr.Open (filename, GC.GA_Update)
-        layer = dataset.GetLayer ()
-        
-        if layer.FindFieldIndex (self.ID_FIELD, True) < 0:  # ID field does not exist yet
-            idField = ogr.FieldDefn (self.ID_FIELD, ogr.OFTInteger)
-            layer.CreateField (idField)
+        with VectorFormat.openForUpdate (filename) as (_dataset, layer):
+            if layer.FindFieldIndex (self.ID_FIELD, True) < 0:  # ID field does not exist yet
+                idField = ogr.FieldDefn (self.ID_FIELD, ogr.OFTInteger)
+                layer.CreateField (idField)
             
-        idFieldIndex = layer.FindFieldIndex (self.ID_FIELD, True)
+            idFieldIndex = layer.FindFieldIndex (self.ID_FIELD, True)
         
-        for feature in layer:
-            feature.SetField (idFieldIndex, self.UniqueID)
-            layer.SetFeature (feature)
-            self.UniqueID += 1 
-        
-        dataset = None 
+            fids = VectorStream (layer, geometry = False).readAll ()[VectorStream.FID]
+            ids = NPy.arange (self.UniqueID, self.UniqueID + len (fids), dtype = NPy.int64)
+
+            VectorStream.updateFields (layer, fids, {idFieldIndex : ids})
+            self.UniqueID += len (fids)
         
 if __name__ == "__main__":
     args = sys.argv[1:]
     
     if len (args) == 0:
         sys.stdout.write (
-            "\nUSAGE: [python] CLUIdentifier.py file1.shp [file2.shp ...]\n\n")
+            "\nUSAGE: [python] CLUIdentifier.py file1.shp|gpkg|fgb [file2 ...]\n\n")
         
     else:
         cluid = CLUIdentifier (args, verbose = True)
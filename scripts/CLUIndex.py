@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+from typing import Dict, List, Optional, Tuple
+
+from osgeo import ogr
+from osgeo import gdalconst as GC
+
+import numpy as NPy
+
+import os
+import sys
+
+from FileFingerprint import FileFingerprint
+from VectorStream import VectorStream
+
+class CLUIndex:
+    ''' persistent packed Hilbert R-tree over the feature envelopes of a CLU
+        file, kept next to it; answers "which CLUs touch this window" without
+        scanning the layer. The index is reused while the file keeps its
+        identity (size, modification time) or, failing that, its content hash '''
+
+    EXTENSION       = ".cluidx.npz"
+    VERSION         = 1
+
+    NODE_SIZE       = 16            # children per tree node
+    HILBERT_ORDER   = 16            # bits per axis of the Hilbert grid
+
+    TWindow = Tuple[float, float, float, float]     # west, south, east, north
+
+    def __init__ (self, filename: str, nodeSize: int = NODE_SIZE):
+        ''' initializer
+
+            @param filename: CLU file (shapefile, GeoPackage or FlatGeobuf)
+            @param nodeSize: children per tree node (when building) '''
+
+        self.Filename = filename
+        self.NodeSize = nodeSize
+        self.FIDs: NPy.ndarray = NPy.zeros (0, dtype = NPy.int64)
+        self.Types: NPy.ndarray = NPy.zeros (0, dtype = NPy.int32)
+        self.Levels: List[NPy.ndarray] = []
+
+    @classmethod
+    def name (clss, filename: str) -> str:
+        ''' name of the index file of a CLU file '''
+
+        return filename + clss.EXTENSION
+
+    def load (self) -> "CLUIndex":
+        ''' load the index, building (and saving) it when it is missing or
+            the CLU file has changed
+
+            @return: self '''
+
+        identity = FileFingerprint.identity (self.Filename)
+        stored = self.read ()
+        digest = None
+
+        if stored is not None and tuple (stored["identity"].tolist ()) != identity:
+            digest = FileFingerprint.digest (self.Filename)
+            if str (stored["digest"]) != digest:
+                stored = None
+            else:
+                self.adopt (stored)         # touched, not changed: only refresh the identity
+                self.save (identity, digest)
+
+        if stored is None:
+            self.build ()
+            self.save (identity, digest or FileFingerprint.digest (self.Filename))
+        else:
+            self.adopt (stored)
+
+        return self
+
+    def read (self) -> Optional[Dict[str, NPy.ndarray]]:
+        ''' read the stored index, if there is a usable one '''
+
+        result = None
+        indexFile = self.name (self.Filename)
+
+        if os.path.exists (indexFile):
+            with NPy.load (indexFile, allow_pickle = False) as npz:
+                stored = dict (npz)
+
+            if int (stored.get ("version", -1)) == self.VERSION:
+                result = stored
+
+        return result
+
+    def adopt (self, stored: Dict[str, NPy.ndarray]):
+        ''' take over the arrays of a stored index '''
+
+        self.NodeSize = int (stored["nodeSize"])
+        self.FIDs = stored["fids"]
+        self.Types = stored["types"]
+        self.Levels = [stored[f"level{i}"] for i in range (int (stored["nLevels"]))]
+
+    def save (self, identity: FileFingerprint.TIdentity, digest: str):
+        ''' write the index next to the CLU file (atomically) '''
+
+        indexFile = self.name (self.Filename)
+        tmpFile = indexFile + ".tmp.npz"
+
+        levels = {f"level{i}" : level for i, level in enumerate (self.Levels)}
+        NPy.savez (tmpFile,
+                   version = self.VERSION,
+                   identity = NPy.array (identity, dtype = NPy.int64),
+                   digest = digest,
+                   nodeSize = self.NodeSize,
+                   nLevels = len (self.Levels),
+                   fids = self.FIDs,
+                   types = self.Types,
+                   **levels)
+
+        os.replace (tmpFile, indexFile)
+
+    def build (self):
+        ''' read all envelopes in bulk and pack them into the tree '''
+
+        ds = ogr.Open (self.Filename, GC.GA_ReadOnly)
+        columns = VectorStream (ds.GetLayer ()).readAll ()
+        ds = None
+
+        boxes = columns[VectorStream.ENVELOPE][:, [0, 2, 1, 3]]    # west, south, east, north
+        present = ~NPy.isnan (boxes).any (axis = 1)
+
+        self.pack (columns[VectorStream.FID][present],
+                   columns[VectorStream.GEOMETRY_TYPE][present],
+                   boxes[present])
+
+    def pack (self, fids: NPy.ndarray, types: NPy.ndarray, boxes: NPy.ndarray):
+        ''' sort the items along the Hilbert curve and build the node levels
+            bottom up; level 0 holds the item boxes, the last level the root
+
+            @param fids: feature IDs
+            @param types: geometry types
+            @param boxes: N x 4 (west, south, east, north) boxes '''
+
+        order = NPy.argsort (self.hilbert (boxes), kind = "stable")
+
+        self.FIDs = fids[order]
+        self.Types = types[order]
+        self.Levels = [boxes[order]]
+
+        while len (self.Levels[-1]) > 1:
+            level = self.Levels[-1]
+            starts = NPy.arange (0, len (level), self.NodeSize)
+            self.Levels.append (NPy.column_stack ((NPy.minimum.reduceat (level[:, 0], starts),
+                                                   NPy.minimum.reduceat (level[:, 1], starts),
+                                                   NPy.maximum.reduceat (level[:, 2], starts),
+                                                   NPy.maximum.reduceat (level[:, 3], starts))))
+
+    def hilbert (self, boxes: NPy.ndarray) -> NPy.ndarray:
+        ''' Hilbert curve distance of the box centers on a 2^order grid over
+            the extent of all boxes
+
+            @param boxes: N x 4 (west, south, east, north) boxes
+            @return: distances '''
+
+        side = (1 << self.HILBERT_ORDER) - 1
+        result = NPy.zeros (len (boxes), dtype = NPy.int64)
+
+        if len (boxes) > 0:
+            cx = (boxes[:, 0] + boxes[:, 2]) / 2
+            cy = (boxes[:, 1] + boxes[:, 3]) / 2
+            spanX = max (cx.max () - cx.min (), 1e-12)
+            spanY = max (cy.max () - cy.min (), 1e-12)
+
+            x = ((cx - cx.min ()) / spanX * side).astype (NPy.int64)
+            y = ((cy - cy.min ()) / spanY * side).astype (NPy.int64)
+
+            s = 1 << (self.HILBERT_ORDER - 1)
+            while s > 0:
+                rx = (x & s) > 0
+                ry = (y & s) > 0
+                result += s * s * ((3 * rx) ^ ry)
+
+                flip = ~ry                          # rotate the quadrant
+                swap = flip & rx
+                x = NPy.where (swap, side - x, x)
+                y = NPy.where (swap, side - y, y)
+                x, y = NPy.where (flip, y, x), NPy.where (flip, x, y)
+                s >>= 1
+
+        return result
+
+    def query (self, window: TWindow) -> NPy.ndarray:
+        ''' find the items whose boxes intersect a window, descending the
+            tree one level at a time
+
+            @param window: (west, south, east, north) in layer coordinates
+            @return: positions of the items (index into FIDs and Types), in tree order '''
+
+        west, south, east, north = window
+        candidates = NPy.zeros (min (1, len (self.Levels[-1])) if self.Levels else 0, dtype = NPy.int64)
+
+        for depth in range (len (self.Levels) - 1, -1, -1):
+            boxes = self.Levels[depth][candidates]
+            hits = candidates[(boxes[:, 0] <= east) & (boxes[:, 2] >= west) &
+                              (boxes[:, 1] <= north) & (boxes[:, 3] >= south)]
+
+            if depth > 0:
+                nChildren = len (self.Levels[depth - 1])
+                first = hits * self.NodeSize
+                counts = NPy.minimum (first + self.NodeSize, nChildren) - first
+                candidates = NPy.repeat (first - NPy.cumsum (counts) + counts, counts) + \
+                             NPy.arange (counts.sum ())
+            else:
+                candidates = hits
+
+        return candidates
+
+    def queryFIDs (self, window: TWindow) -> NPy.ndarray:
+        ''' feature IDs of the CLUs intersecting a window, in ascending order '''
+
+        return NPy.sort (self.FIDs[self.query (window)])
+
+    def envelopes (self, positions: NPy.ndarray) -> NPy.ndarray:
+        ''' item envelopes in the OGR order (west, east, south, north) '''
+
+        return self.Levels[0][positions][:, [0, 2, 1, 3]]
+
+# ..................................... MAIN ................................
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+
+    if len (args) > 0:
+        for clufile in args:
+            sys.stdout.write (f"Indexing {clufile} ...")
+            sys.stdout.flush ()
+            index = CLUIndex (clufile).load ()
+            sys.stdout.write (f" {len (index.FIDs)} CLUs\n")
+
+    else:
+        app = os.path.basename (sys.argv[0])
+        sys.stderr.write (f"\nUSAGE: [python3] {app} file1.shp|gpkg|fgb [file2 ...]\n\n")
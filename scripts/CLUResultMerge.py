@@ -3,13 +3,15 @@
 import sys 
 import os 
 import re 
-import shutil 
 
 import numpy 
 
 from osgeo import gdal 
 from osgeo import gdalconst as GC 
 
+from HistogramSidecar import HistogramSidecar
+from FileStaging import FileStaging
+
 class CLUResultMerge:
     ''' Merges the cleaned up result from CLUCalculator with the 
         raw maps. Areas covered by CLU data (and thus cleaned 
@@ -52,6 +54,27 @@ class CLUResultMerge:
                 sys.stdout.flush ()
                 self.merge1 (f)
                 
+    @classmethod
+    def combine (clss, cleanData, cluData, baseData):
+        ''' combine clean and raw layer - use clean data where CLU data 
+            are known and raw data everywhere else 
+
+            @param cleanData: pixels of the clean map 
+            @param cluData: pixels of the CLU raster (None for no CLUs) 
+            @param baseData: pixels of the raw map 
+            @return: merged pixels '''
+
+        cleanData = cleanData.astype (numpy.byte)
+        baseData = baseData.astype (numpy.byte)
+
+        # CLU mask (1 where CLU data are known, 0 elsewhere)
+        if cluData is not None:
+            cluMask = (cluData != 0).astype (numpy.byte)
+        else:
+            cluMask = numpy.zeros (shape = cleanData.shape, dtype = numpy.byte)
+
+        return cluMask * cleanData + (1 - cluMask) * baseData 
+
     def merge1 (self, filename):
         ''' perform merge on one file 
          
@@ -69,39 +92,34 @@ class CLUResultMerge:
         # get the raster of clean map 
         cleanDataset = gdal.Open (cleanMapFile, GC.GA_ReadOnly)
         cleanLayer = cleanDataset.GetRasterBand (self.DEFAULT_BAND)
-        cleanData = cleanLayer.ReadAsArray ().astype (numpy.byte)
+        cleanData = cleanLayer.ReadAsArray ()
         cleanDataset = None 
 
-        # create CLU mask (1 where CLU data are known, 0 elsewhere)
+        # CLU raster (if CLU dataset does not exist, the mask is empty)
+        cluData = None
         if os.path.exists (cluFile):
             cluDataset = gdal.Open (cluFile, GC.GA_ReadOnly)
             cluLayer = cluDataset.GetRasterBand (self.DEFAULT_BAND) 
-            cluMask = cluLayer.ReadAsArray ()
-            cluMask = (cluMask != 0)
-            cluMask = cluMask.astype (numpy.byte)
+            cluData = cluLayer.ReadAsArray ()
             cluDataset = None
-        else:
-            cluMask = numpy.ndarray (shape = cleanData.shape)
-            cluMask.fill (0)    # if CLU dataset does not exist, the mask is empty 
-                                # but still needs to be created 
         
         # same for the data from raw (base) map
         baseDataset = gdal.Open (baseMapFile, GC.GA_ReadOnly)
         baseLayer = baseDataset.GetRasterBand (self.DEFAULT_BAND)
-        baseData = baseLayer.ReadAsArray ().astype (numpy.byte)
+        baseData = baseLayer.ReadAsArray ()
         baseDataset = None
         
-        # combine clean and raw layer - use clean data where 
-        # CLU mask is 1 and raw data everywhere else 
-        mergedData = cluMask * cleanData + (1 - cluMask) * baseData 
+        mergedData = self.combine (cleanData, cluData, baseData)
         
         # create output file 
         outputName = os.path.join (self.OutputPath, filename)
-        shutil.copy (baseMapFile, outputName)
+        FileStaging.stage (baseMapFile, outputName, mutable = True)
         outputDataset = gdal.Open (outputName, GC.GA_Update)
         outputLayer = outputDataset.GetRasterBand (self.DEFAULT_BAND)
         outputLayer.WriteArray (mergedData)
         outputDataset = None 
+
+        HistogramSidecar.fromArray (outputName, mergedData)
         
         
 if __name__ == "__main__":
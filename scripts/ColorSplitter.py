@@ -7,6 +7,8 @@ import numpy as NP
 
 import os 
 
+from RasterUtils import RasterUtils
+
 class ColorSplitter:
     ''' takes a multicolor GTiff files and generates a collection of 
         single layer GTiff files, each only containting pixels of 
@@ -14,79 +16,103 @@ class ColorSplitter:
 
     DEFAULT_NO_DATA_VALUE           = 0
     DEFAULT_BAND                    = 1
-    DEFAULT_BLOCK_SIZE              = 10000
     
-    OUTNAME_FMT                     = "{base}-{number:2}{ext}"
+    OUTNAME_FMT                     = "{base}-{number:02}{ext}"
     
     def __init__ (self, 
                   image, 
-                  noDataValue = DEFAULT_NO_DATA_VALUE,
-                  blockSize = DEFAULT_BLOCK_SIZE):
+                  noDataValue = DEFAULT_NO_DATA_VALUE):
         
         ''' constructor 
         
             @param image: image to split
-            @param noDataValue: custom value to represent no data,
-            @param blockSize: blocks size (in lines) for reading huge images  '''
+            @param noDataValue: custom value to represent no data '''
         
         self.Image = image 
         self.NoDataValue = noDataValue
-        self.BlockSize = blockSize 
         
     def split (self):
-        ''' perform the split '''
+        ''' perform the split in a single pass over the image: every block 
+            is read once and its pixels are routed to the outputs of all 
+            colors it contains; an output is created when its color is 
+            first seen, blocks never written are filled with NO_VALUE by GDAL 
+
+            @return: {color : output file} '''
         
         dataset = gdal.Open (self.Image, GC.GA_ReadOnly)
-        colors = self.listColors (dataset)
-        print (colors)
-        
-        basename, extension = os.path.splitext ()
-        iColor = 0 
-        driver = gdal.GetDriverByName ('GTiff')
+        band = dataset.GetRasterBand (self.DEFAULT_BAND)
         
-        for c in colors:
-            iColor += 1 
-            outputName = self.OUTNAME_FMT.format (base = basename,
-                                                  number = iColor,
-                                                  ext = extension)
-#             outds = driver.Create (outputName, )
-#             pixelMask = data[data == c]
-            
+        basename, extension = os.path.splitext (self.Image)
+        outputs = {}
+
+        for xOff, yOff, xSize, ySize in RasterUtils.blockWindows (band):
+            data = band.ReadAsArray (xOff, yOff, xSize, ySize)
+
+            for color in RasterUtils.arrayHistogram (data):
+                if color == self.NoDataValue:
+                    continue
+
+                if color not in outputs:
+                    outputName = self.OUTNAME_FMT.format (base = basename,
+                                                          number = color,
+                                                          ext = extension)
+                    outputs[color] = self.createOutput (dataset, outputName)
+
+                outBand = outputs[color].GetRasterBand (self.DEFAULT_BAND)
+                outBand.WriteArray (NP.where (data == color, data, self.NoDataValue), xOff, yOff)
         
+        result = {color : outds.GetDescription () for color, outds in outputs.items ()}
+
+        outputs = None # done with outputs 
         dataset = None # done with image 
+
+        return result 
+
+    def createOutput (self, dataset, filename: str):
+        ''' create an empty single color output like the input image, with 
+            the same block layout so that blocks map one to one 
+
+            @param dataset: input dataset 
+            @param filename: output file 
+            @return: open output dataset '''
+
+        band = dataset.GetRasterBand (self.DEFAULT_BAND)
+        blockX, blockY = band.GetBlockSize ()
+
+        options = ["COMPRESS=DEFLATE", "BIGTIFF=IF_SAFER"]
+        if blockX < dataset.RasterXSize:
+            options += ["TILED=YES", f"BLOCKXSIZE={blockX}", f"BLOCKYSIZE={blockY}"]
+
+        driver = gdal.GetDriverByName ('GTiff')
+        outds = driver.Create (filename, dataset.RasterXSize, dataset.RasterYSize, 1, 
+                               band.DataType, options = options)
+        outds.SetGeoTransform (dataset.GetGeoTransform ())
+        outds.SetProjection (dataset.GetProjection ())
+        outds.GetRasterBand (self.DEFAULT_BAND).SetNoDataValue (self.NoDataValue)
+
+        return outds 
         
     def listColors (self, dataset):
-        ''' find unique values in an array, no counting the 
-            NO_DATA_VALUE pixels 
+        ''' find unique values in the image and their pixel counts, not 
+            counting the NO_DATA_VALUE pixels; byte images use GDAL's native
+            histogram, other types are counted block by block in the file's 
+            own block layout 
             
             @param dataset: open dataset containing the image ot operate on
-            @param return: list of unique items found ''' 
+            @param return: {color : pixel count} for all colors found, sorted by color ''' 
         
         band = dataset.GetRasterBand (self.DEFAULT_BAND)
         
-        uniques = [] 
-        done = False 
-        iBlock = 0
-        blockSize = self.BlockSize 
-        
-        while not done: 
-            startRow = iBlock * blockSize 
-            endRow = startRow + blockSize - 1 
-            
-            if endRow >= band.YSize:
-                blockSize = band.YSize - startRow 
-                done = True
-        
-            data = band.ReadAsArray (0, startRow, band.XSize, blockSize)
-            data = data[data != self.NoDataValue]
-            unique = NP.unique (data)
-            uniques.extend (unique)
-            
-            iBlock += 1
-            
-        uniques = list (set (uniques))
+        if band.DataType == GC.GDT_Byte:
+            counts = band.GetHistogram (-0.5, 255.5, 256, 
+                                        include_out_of_range = 0, approx_ok = 0)
+            colors = {color : n for color, n in enumerate (counts) if n > 0}
+        else:
+            colors = RasterUtils.histogram (band)
+
+        colors.pop (self.NoDataValue, None)
             
-        return uniques
+        return colors
     
 # ...........................................................................
 
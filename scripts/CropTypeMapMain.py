@@ -9,21 +9,109 @@ import shutil
 
 from Utils.TmpFileUtils import TmpFileUtils 
 from RegionCleanup import RegionCleanup
+from RegionScheduler import RegionScheduler
+from StagePipeline import StagePipeline
+from StageCheckpoint import StageCheckpoint
+from FileStaging import FileStaging
 
 from typing import List
 
+PRODUCT_PROJ4 = "+proj=aea +lat_1=29.5 +lat_2=45.5 +lat_0=23 +lon_0=-96 +x_0=0 +y_0=0 +ellps=GRS80 +datum=NAD83 +towgs84=0,0,0,0,0,0,0 +units=m +no_defs"
+PRODUCT_XRES  = 30
+PRODUCT_YRES  = 30
+
+AUXILIARY_DIRECTORIES = [(RAW_SUBDIR     := "raw"), 
+                         (CLEANED_SUBDIR := "clean"), 
+                         (PRODUCT_SUBDIR := "product")]
+
+TMP_PREFIX    = "ctm2020"
+TMP_SUFFIX    = ".ag"
+
+RUN_MODES     = [(FRESH  := "fresh"),       # start over with an empty product directory
+                 (RESUME := "resume")]      # keep finished stages of an earlier run
+
+COPY_STAGE    = "copy"
+
+CLEANUP_BYTES_PER_PIXEL = 24    # raw map, filtered map and the majority filter working set
+
+def initWorker (prefix: str, suffix: str):
+    ''' set up a worker process '''
+
+    TmpFileUtils.init (prefix = prefix, suffix = suffix)
+
+def regionFiles (productdir: str, region: str):
+    ''' files of the stages of a region 
+
+        @param productdir: where the products go 
+        @param region: region name (lower case) 
+        @return: region directory, raw map, cleaned map, product '''
+
+    regionf = f"{region}.tif"
+    regiondir = os.path.join (productdir, region.upper ())
+
+    return regiondir, \
+           os.path.join (regiondir, RAW_SUBDIR, regionf), \
+           os.path.join (regiondir, CLEANED_SUBDIR, regionf), \
+           os.path.join (regiondir, PRODUCT_SUBDIR, regionf)
+
+def isRegionComplete (source: str, productdir: str, region: str) -> bool:
+    ''' check whether all stages of a region completed in an earlier run 
+
+        @param source: basemap of the region 
+        @param productdir: where the products go 
+        @param region: region name (lower case) '''
+
+    regiondir, workmap, cleanMap, productMap = regionFiles (productdir, region)
+    checkpoint = StageCheckpoint (regiondir)
+
+    return checkpoint.isComplete (COPY_STAGE, [source], [workmap]) and \
+           checkpoint.isComplete (RegionCleanup.FILTER_STAGE, [workmap], [cleanMap]) and \
+           checkpoint.isComplete (RegionCleanup.PRODUCT_STAGE, [cleanMap], [productMap])
+
+def cleanupRegion (mapdir: str, productdir: str, basemap: str, region: str):
+    ''' clean up a single region and create its product (runs in a worker process); 
+        every stage is marked complete when it succeeds, stages marked complete 
+        by an earlier run are skipped 
+
+        @param mapdir: where the basemaps are 
+        @param productdir: where the products go 
+        @param basemap: basemap file name 
+        @param region: region name (lower case) '''
+
+    regiondir, workmap, cleanMap, productMap = regionFiles (productdir, region)
+
+    sys.stdout.write (f" -> Processing {region.upper ()} ...\n")
+
+    for f in [workmap, cleanMap, productMap]:
+        os.makedirs (os.path.dirname (f), exist_ok = True)
+
+    checkpoint = StageCheckpoint (regiondir)
+
+    source = os.path.join (mapdir, basemap)
+    StagePipeline.runStage (StagePipeline.IO, checkpoint.run, COPY_STAGE, [source], [workmap], 
+                            FileStaging.stage, source, workmap)
+
+    rc = RegionCleanup ()
+    rc.run (inputf = workmap, 
+            outputf = cleanMap, 
+            productf = productMap, 
+            proj4 = PRODUCT_PROJ4,
+            xres = PRODUCT_XRES,
+            yres = PRODUCT_YRES, 
+            nvreplace = 0,
+            filterChoice = RegionCleanup.MAJORITY_FILTER,
+            checkpoint = checkpoint) 
+            # filterChoice = RegionCleanup.MCQ_FILTER) 
+
 if __name__ == "__main__":
     
     REQUIRED_ARGS = 2 
-
-    PRODUCT_PROJ4 = "+proj=aea +lat_1=29.5 +lat_2=45.5 +lat_0=23 +lon_0=-96 +x_0=0 +y_0=0 +ellps=GRS80 +datum=NAD83 +towgs84=0,0,0,0,0,0,0 +units=m +no_defs"
-    PRODUCT_XRES  = 30
-    PRODUCT_YRES  = 30
+    OPTIONAL_ARGS = 4
 
     args = sys.argv[1:]
     nArgs = len (args)
 
-    if nArgs == REQUIRED_ARGS:
+    if REQUIRED_ARGS <= nArgs <= REQUIRED_ARGS + OPTIONAL_ARGS:
         RGX_MAP_NAME = "([a-z,A-Z]{2}).tif$"
 
         # REGIONS = ["AL", "AR", "CO", "FL", 
@@ -56,61 +144,54 @@ if __name__ == "__main__":
         
         # SKIP: List[str] = []
 
-        mapdir, productdir = args
+        mapdir, productdir = args[:REQUIRED_ARGS]
+        workers = int (args[REQUIRED_ARGS]) if nArgs > REQUIRED_ARGS else None
+        budget = int (float (args[REQUIRED_ARGS + 1]) * (1 << 30)) if nArgs > REQUIRED_ARGS + 1 else None
+        ioslots = int (args[REQUIRED_ARGS + 2]) if nArgs > REQUIRED_ARGS + 2 else None
+        mode = args[REQUIRED_ARGS + 3] if nArgs > REQUIRED_ARGS + 3 else FRESH
         basemaps = sorted (os.listdir (mapdir))
 
-        if os.path.exists (productdir):
+        if mode not in RUN_MODES:
+            raise ValueError (f"Unknown run mode '{mode}'")
+
+        if mode == FRESH and os.path.exists (productdir):
             shutil.rmtree (productdir)
 
-        if not os.path.exists (productdir):
-            os.makedirs (productdir)
+        os.makedirs (productdir, exist_ok = True)
 
-        AUXILIARY_DIRECTORIES = [(RAW_SUBDIR     := "raw"), 
-                                 (CLEANED_SUBDIR := "clean"), 
-                                 (PRODUCT_SUBDIR := "product")]
+        TmpFileUtils.init (prefix = TMP_PREFIX, suffix = TMP_SUFFIX)
 
-        TmpFileUtils.init (prefix = "ctm2020", suffix = ".ag")
+        scheduler = StagePipeline.scheduler (cpu = workers,
+                                             io = ioslots,
+                                             budget = budget,
+                                             initializer = initWorker,
+                                             initargs = (TMP_PREFIX, TMP_SUFFIX),
+                                             verbose = True)
 
         for basemap in basemaps:
             match = re.match (RGX_MAP_NAME, basemap)
             if match is not None:
                 region = match.group (1).lower ()
-                regionf = f"{region}.tif"
                 regiondir = region.upper ()
 
-                # if regiondir != "OH":
-                #     continue
-
                 if REGIONS is None or (regiondir in REGIONS and regiondir not in SKIP):
-                    sys.stdout.write (f" -> Processing {regiondir} ...\n")
-                    rawdir = os.path.join (productdir, regiondir, RAW_SUBDIR)
-                    cleandir = os.path.join (productdir, regiondir, CLEANED_SUBDIR)
-                    finaldir = os.path.join (productdir, regiondir, PRODUCT_SUBDIR)
-
-                    for d in [rawdir, cleandir, finaldir]:
-                        os.makedirs (d)
-
                     source = os.path.join (mapdir, basemap)
-                    workmap = os.path.join (rawdir, regionf)
-                    shutil.copy (source, workmap)
 
-                    cleanMap = os.path.join (cleandir, regionf)
-                    productMap = os.path.join (finaldir, regionf)
+                    if mode == RESUME and isRegionComplete (source, productdir, region):
+                        sys.stdout.write (f" -> {regiondir} is complete\n")
+                        continue
 
-                    rc = RegionCleanup ()
-                    rc.run (inputf = workmap, 
-                            outputf = cleanMap, 
-                            productf = productMap, 
-                            proj4 = PRODUCT_PROJ4,
-                            xres = 30,
-                            yres = 30, 
-                            nvreplace = 0,
-                            filterChoice = RegionCleanup.MAJORITY_FILTER) 
-                            # filterChoice = RegionCleanup.MCQ_FILTER) 
+                    memory = RegionScheduler.estimateMemory (source, bytesPerPixel = CLEANUP_BYTES_PER_PIXEL)
+                    scheduler.add (regiondir, cleanupRegion, 
+                                   mapdir, productdir, basemap, region, 
+                                   memory = memory)
 
-        TmpFileUtils.cleanup ()
+        try:
+            scheduler.run ()
+        finally:
+            TmpFileUtils.cleanup ()
 
     else:
         app = os.path.basename (sys.argv[0])
-        sys.stderr.write (f"\nUSAGE: {app} mapdir productdir \n\n")
+        sys.stderr.write (f"\nUSAGE: {app} mapdir productdir [workers [memory-GB [io-slots [fresh|resume]]]]\n\n")
         
\ No newline at end of file
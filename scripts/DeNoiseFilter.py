@@ -6,10 +6,11 @@ import numpy as NPy
 from scipy import ndimage 
 from scipy.ndimage import morphology 
 
-import shutil 
 import sys 
 import os 
 
+from FileStaging import FileStaging
+
 class DeNoiseFilter:
     ''' denoising filter with focus on preserving data consistency (over 
         the visual appeal of the denoised data) '''
@@ -61,7 +62,7 @@ class DeNoiseFilter:
         img = self.declutter (img)
         img = self.corefill (img)
 
-        shutil.copy (inputf, outputf) # fast way to clone the entire dataset 
+        FileStaging.stage (inputf, outputf, mutable = True) # fast way to clone the entire dataset 
 
         dsOutput = gdal.Open (outputf, GConst.GA_Update)
         b1 = dsOutput.GetRasterBand (1)
@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+
+from typing import Any, Dict, List, Optional, Tuple
+
+class FileFingerprint:
+    ''' cheap identity and content digests of files, and the atomic writes 
+        of the records that keep them '''
+
+    CHUNK_SIZE      = 1 << 24
+    DIGEST_SIZE     = 20
+
+    TIdentity = Tuple[int, int]
+
+    @classmethod
+    def identity (clss, filename: str) -> TIdentity:
+        ''' identity of a file as seen by the file system 
+
+            @param filename: file to identify 
+            @return: (size, modification time in ns) '''
+
+        st = os.stat (filename)
+
+        return st.st_size, st.st_mtime_ns
+
+    @classmethod
+    def identities (clss, filenames: List[str]) -> Dict[str, Any]:
+        ''' identities of files, as stored in JSON records 
+
+            @param filenames: files to identify 
+            @return: {file : [size, mtime]} (None for missing files) '''
+
+        return {filename : list (clss.identity (filename)) if os.path.exists (filename) else None
+                for filename in filenames}
+
+    @classmethod
+    def digest (clss, filename: str) -> str:
+        ''' content hash of a file, read in large chunks 
+
+            @param filename: file to hash 
+            @return: hex digest '''
+
+        hasher = hashlib.blake2b (digest_size = clss.DIGEST_SIZE)
+
+        with open (filename, "rb") as f:
+            while chunk := f.read (clss.CHUNK_SIZE):
+                hasher.update (chunk)
+
+        return hasher.hexdigest ()
+
+    @classmethod
+    def writeJSON (clss, filename: str, content: Any, indent: Optional[int] = 1):
+        ''' write a JSON record atomically: to a temporary file flushed to 
+            disk first, then renamed into place 
+
+            @param filename: record file 
+            @param content: JSON serializable content 
+            @param indent: JSON indentation '''
+
+        tmpFile = filename + ".tmp"
+
+        with open (tmpFile, "w") as f:
+            json.dump (content, f, indent = indent)
+            f.flush ()
+            os.fsync (f.fileno ())
+
+        os.replace (tmpFile, filename)
@@ -0,0 +1,102 @@
+from typing import List
+
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:             # no reflinks off Linux
+    fcntl = None
+
+class FileStaging:
+    ''' puts a file where a stage expects it without copying its content when
+        possible: a hard link or a symbolic link share the source, a reflink
+        shares its blocks until one side is written. Files a later stage
+        writes to are only reflinked or copied, so the source stays intact '''
+
+    METHODS         = [(HARDLINK := "hardlink"),    # same file system, read-only use
+                       (REFLINK  := "reflink"),     # copy-on-write clone (btrfs, XFS)
+                       (SYMLINK  := "symlink"),     # any file system, read-only use
+                       (COPY     := "copy")]
+
+    FICLONE         = 0x40049409                    # ioctl cloning a whole file (linux/fs.h)
+
+    @classmethod
+    def stage (clss, source: str, target: str, 
+                     mutable: bool = False, 
+                     durable: bool = False) -> str:
+
+        ''' stage a file, by the cheapest method that is safe for its use
+
+            @param source: file to stage
+            @param target: where it is expected (replaced if it exists)
+            @param mutable: True if the staged file is going to be modified
+            @param durable: True if the staged file must outlive the source 
+                            (no symbolic link)
+            @return: method used, one of METHODS '''
+
+        if os.path.lexists (target):
+            os.remove (target)
+
+        result = None
+
+        for method in clss.methods (mutable, durable):
+            if clss.tryMethod (method, source, target):
+                result = method
+                break
+
+        return result
+
+    @classmethod
+    def methods (clss, mutable: bool, durable: bool = False) -> List[str]:
+        ''' staging methods to try, cheapest first '''
+
+        if mutable:
+            result = [clss.REFLINK, clss.COPY]
+        elif durable:
+            result = [clss.HARDLINK, clss.REFLINK, clss.COPY]
+        else:
+            result = clss.METHODS
+
+        return result
+
+    @classmethod
+    def tryMethod (clss, method: str, source: str, target: str) -> bool:
+        ''' stage a file by a given method
+
+            @return: True on success; False if the method is not available
+                     for these files (copying always is) '''
+
+        result = True
+
+        try:
+            if method == clss.HARDLINK:
+                os.link (source, target)
+            elif method == clss.REFLINK:
+                clss.reflink (source, target)
+            elif method == clss.SYMLINK:
+                os.symlink (os.path.abspath (source), target)
+            else:
+                shutil.copy (source, target)
+
+        except OSError:
+            if method == clss.COPY:
+                raise
+
+            if os.path.lexists (target):
+                os.remove (target)
+            result = False
+
+        return result
+
+    @classmethod
+    def reflink (clss, source: str, target: str):
+        ''' clone a file sharing its blocks (copy on write) '''
+
+        if fcntl is None:
+            raise OSError ("Reflinks are not supported on this platform")
+
+        with open (source, "rb") as src, open (target, "wb") as dst:
+            fcntl.ioctl (dst.fileno (), clss.FICLONE, src.fileno ())
+
+        shutil.copymode (source, target)
@@ -1,5 +1,8 @@
 from osgeo import gdal
 from osgeo import gdalconst as GC 
+from osgeo import osr
+
+import numpy as NPy
 
 import math 
 
@@ -7,6 +10,20 @@ class GeoTransform:
     ''' helper class to transform between pixel and geographical coordinate systems ''' 
      
     FMT = "X :: {0:+13.8f}/{1:+13.10f}; Y :: {2:+13.8f}/{3:+13.10f}"
+
+    EQUAL_AREA_PROJECTIONS  = ["Albers_Conic_Equal_Area",
+                               "Lambert_Azimuthal_Equal_Area",
+                               "Cylindrical_Equal_Area",
+                               "Mollweide",
+                               "Sinusoidal",
+                               "Eckert_IV",
+                               "Eckert_VI"]
+
+    # normal aspect cylindrical projections - pixel area depends on the row only
+    CYLINDRICAL_PROJECTIONS = ["Mercator_1SP",
+                               "Mercator_2SP",
+                               "Equirectangular",
+                               "Miller_Cylindrical"]
     
     def __init__ (self, datafile = None, dataset = None):
         ''' constructor 
@@ -22,6 +39,8 @@ class GeoTransform:
         self.YOrig,
         _yrot,
         self.YStep) = self.Dataset.GetGeoTransform ()
+
+        self.Projection = self.Dataset.GetProjection ()
         
         if dataset is None:      # if we opened the dataset here, 
             self.Dataset = None  # close it, we don't need it anymore, otherwise leave it alone
@@ -31,6 +50,93 @@ class GeoTransform:
 
         return math.fabs (self.XStep * self.YStep)
 
+    def spatialReference (self):
+        ''' spatial reference of the transformation 
+
+            @return: osr.SpatialReference or None if the dataset has no projection '''
+
+        result = None
+
+        if self.Projection:
+            result = osr.SpatialReference ()
+            result.ImportFromWkt (self.Projection)
+            result.SetAxisMappingStrategy (osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+        return result
+
+    def isEqualArea (self) -> bool:
+        ''' check whether all pixels cover the same area on the ground '''
+
+        srs = self.spatialReference ()
+
+        return srs is not None and srs.IsProjected () == 1 and \
+               srs.GetAttrValue ("PROJECTION") in self.EQUAL_AREA_PROJECTIONS
+
+    def isRowSeparable (self) -> bool:
+        ''' check whether pixel area on the ground depends on the row only 
+            (geographic coordinates or normal aspect cylindrical projections) '''
+
+        srs = self.spatialReference ()
+
+        return srs is not None and \
+               (srs.IsGeographic () == 1 or \
+                (srs.IsProjected () == 1 and 
+                 srs.GetAttrValue ("PROJECTION") in self.CYLINDRICAL_PROJECTIONS))
+
+    def getMetricPixelArea (self) -> float:
+        ''' return area of a pixel in square meters (equal area projections) '''
+
+        return self.getPixelArea () * self.spatialReference ().GetLinearUnits () ** 2
+
+    def getRowPixelAreas (self, nRows: int) -> NPy.ndarray:
+        ''' compute area of a pixel in each row, in square meters, on the 
+            ellipsoid of the spatial reference 
+
+            @param nRows: number of rows 
+            @return: vector of pixel areas, one per row '''
+
+        if self.isEqualArea ():
+            result = NPy.full (nRows, self.getMetricPixelArea ())
+
+        else:
+            srs = self.spatialReference ()
+            geo = srs.CloneGeogCS ()
+            geo.SetAxisMappingStrategy (osr.OAMS_TRADITIONAL_GIS_ORDER)
+            toGeo = osr.CoordinateTransformation (srs, geo)
+
+            yEdges = self.YOrig + self.YStep * NPy.arange (nRows + 1)
+            west = toGeo.TransformPoints ([(self.XOrig, y) for y in yEdges])
+            east = toGeo.TransformPoints ([(self.XOrig + self.XStep, y) for y in yEdges])
+
+            latitudes = NPy.radians ([p[1] for p in west])
+            lonSpan = math.radians (math.fabs (east[0][0] - west[0][0]))
+
+            a = geo.GetSemiMajor ()
+            b = geo.GetSemiMinor ()
+            q = self.authalicQ (latitudes, 1 - (b * b) / (a * a))
+            result = a * a * lonSpan / 2 * NPy.abs (NPy.diff (q))
+
+        return result 
+
+    def authalicQ (self, latitudes: NPy.ndarray, e2: float) -> NPy.ndarray:
+        ''' the q function of authalic latitude (Snyder, eq. 3-12); the area 
+            between two parallels over a longitude span dl is a^2 dl |q2 - q1| / 2 
+
+            @param latitudes: latitudes in radians 
+            @param e2: squared eccentricity of the ellipsoid 
+            @return: q for each latitude '''
+
+        sinPhi = NPy.sin (latitudes)
+
+        if e2 == 0:
+            result = 2 * sinPhi
+        else:
+            e = math.sqrt (e2)
+            result = (1 - e2) * (sinPhi / (1 - e2 * sinPhi * sinPhi) - 
+                                 NPy.log ((1 - e * sinPhi) / (1 + e * sinPhi)) / (2 * e))
+
+        return result 
+
     def pixelCoords (self, latitude, longitude):
         ''' convert longitude -> x and latitude -> y 
         
@@ -71,6 +177,38 @@ class GeoTransform:
         
         return (longitude - self.XOrig) / self.XStep 
      
+    def pixelWindows (self, envelopes, xSize: int, ySize: int):
+        ''' convert many geographical rectangles to pixel windows at once;
+            partial pixels are included and windows are clipped to the image 
+
+            @param envelopes: N x 4 array of (west, east, south, north) rows, 
+                              the order of OGR envelopes 
+            @param xSize: image width 
+            @param ySize: image height 
+            @return: N x 4 integer array of (xoff, yoff, xsize, ysize) windows 
+                     and a boolean vector, False where a window is empty '''
+
+        envelopes = NPy.asarray (envelopes, dtype = NPy.float64).reshape (-1, 4)
+        west, east, south, north = envelopes.T
+
+        pxS = self.lat2row (south)
+        pxN = self.lat2row (north)
+        pxW = self.lon2col (west)
+        pxE = self.lon2col (east)
+
+        pxS = NPy.trunc (pxS + (pxS != NPy.trunc (pxS)))  # include partial pixels
+        pxE = NPy.trunc (pxE + (pxE != NPy.trunc (pxE)))
+
+        pxN = NPy.maximum (NPy.trunc (pxN), 0)          # limit data cutout to within the image
+        pxS = NPy.minimum (pxS, ySize - 1)
+        pxW = NPy.maximum (NPy.trunc (pxW), 0)
+        pxE = NPy.minimum (pxE, xSize - 1)
+
+        windows = NPy.stack ((pxW, pxN, pxE - pxW + 1, pxS - pxN + 1), axis = 1).astype (NPy.int64)
+        valid = (windows[:, 2] >= 0) & (windows[:, 3] >= 0)
+
+        return windows, valid 
+
     def row2lat (self, row):
         ''' convert row -> latitude 
         
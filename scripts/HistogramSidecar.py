@@ -0,0 +1,159 @@
+import json
+import os
+
+from typing import Any, Dict, Optional, Tuple
+
+from AreaCounter import AreaCounter
+from GeoTransform import GeoTransform
+from FileFingerprint import FileFingerprint
+
+from osgeo import gdalconst as GConst
+from osgeo import gdal
+from osgeo import gdal_array
+
+import numpy as NPy
+
+class HistogramSidecar:
+    ''' small per-class pixel count and pixel area summary kept next to 
+        a stage raster, so that audits do not have to read the raster again; 
+        a sidecar is only trusted while the raster keeps its size and 
+        modification time '''
+
+    EXTENSION       = ".hist.json"
+    VERSION         = 1
+
+    TSidecar = Tuple[Dict[str, Any], Any]
+
+    @classmethod
+    def name (clss, filename: str) -> str:
+        ''' name of the sidecar of a raster '''
+
+        return filename + clss.EXTENSION
+
+    @classmethod
+    def fromArray (clss, filename: str, data: NPy.ndarray):
+        ''' emit sidecar for a raster that was just written from data in memory 
+
+            @param filename: raster (already closed) 
+            @param data: all pixels of its first band '''
+
+        ds = gdal.Open (filename, GConst.GA_ReadOnly)
+        band = ds.GetRasterBand (1)
+        bandType = gdal_array.GDALTypeCodeToNumericTypeCode (band.DataType)
+
+        if data.dtype == bandType and data.shape == (band.YSize, band.XSize):
+            summary = AreaCounter ().summarize (GeoTransform (dataset = ds), data = data)
+            noDataValue = band.GetNoDataValue ()
+            ds = None
+            clss.write (filename, summary, noDataValue)
+        else:
+            ds = None               # data would be converted on write, count what is stored
+            clss.fromFile (filename)
+
+    @classmethod
+    def fromCounts (clss, filename: str, counts: Dict[Any, int]):
+        ''' emit sidecar from pixel counts collected while writing a raster 
+
+            @param filename: raster (already closed) 
+            @param counts: {value : pixel count} of its first band '''
+
+        ds = gdal.Open (filename, GConst.GA_ReadOnly)
+        gtrans = GeoTransform (dataset = ds)
+        noDataValue = ds.GetRasterBand (1).GetNoDataValue ()
+        ds = None
+
+        if gtrans.isEqualArea ():
+            summary = {"counts"    : dict (sorted (counts.items ())),
+                       "pixelArea" : gtrans.getMetricPixelArea (),
+                       "areas"     : None}
+            clss.write (filename, summary, noDataValue)
+        else:
+            clss.fromFile (filename)
+
+    @classmethod
+    def fromFile (clss, filename: str):
+        ''' emit sidecar by reading the raster (for writers that do not 
+            have the pixels at hand, e.g. external tools) 
+
+            @param filename: raster '''
+
+        ds = gdal.Open (filename, GConst.GA_ReadOnly)
+        band = ds.GetRasterBand (1)
+        summary = AreaCounter ().summarize (GeoTransform (dataset = ds), band = band)
+        noDataValue = band.GetNoDataValue ()
+        ds = None
+
+        clss.write (filename, summary, noDataValue)
+
+    @classmethod
+    def copy (clss, source: str, target: str):
+        ''' emit sidecar for a verbatim copy of a raster 
+
+            @param source: original raster 
+            @param target: its copy '''
+
+        if (sidecar := clss.read (source)) is not None:
+            clss.write (target, *sidecar)
+        else:
+            clss.fromFile (target)
+
+    @classmethod
+    def write (clss, filename: str, summary: Optional[Dict[str, Any]], noDataValue: Any):
+        ''' write the sidecar of a raster (atomically); a summary of None 
+            removes a stale sidecar 
+
+            @param filename: raster 
+            @param summary: summary as produced by AreaCounter.summarize 
+            @param noDataValue: no-data value of the raster '''
+
+        sidecar = clss.name (filename)
+
+        if summary is None:
+            if os.path.exists (sidecar):
+                os.unlink (sidecar)
+
+        else:
+            size, mtime = FileFingerprint.identity (filename)
+            pairs = lambda d: list (d.items ()) if d is not None else None
+
+            content = {"version"   : clss.VERSION,
+                       "model"     : AreaCounter.AREA_MODEL,
+                       "size"      : size,
+                       "mtime"     : mtime,
+                       "nodata"    : noDataValue,
+                       "counts"    : pairs (summary["counts"]),
+                       "pixelArea" : summary["pixelArea"],
+                       "areas"     : pairs (summary["areas"])}
+
+            tmpName = sidecar + ".tmp"
+            with open (tmpName, "w") as f:
+                json.dump (content, f)
+            os.replace (tmpName, sidecar)
+
+    @classmethod
+    def read (clss, filename: str) -> Optional[TSidecar]:
+        ''' read the sidecar of a raster, if there is a valid one 
+
+            @param filename: raster 
+            @return: (summary, no-data value) or None '''
+
+        result = None
+        sidecar = clss.name (filename)
+
+        if os.path.exists (sidecar) and os.path.exists (filename):
+            with open (sidecar, "r") as f:
+                content = json.load (f)
+
+            size, mtime = FileFingerprint.identity (filename)
+            unpair = lambda p: {value : n for value, n in p} if p is not None else None
+
+            if content.get ("version") == clss.VERSION and \
+               content.get ("model") == AreaCounter.AREA_MODEL and \
+               content["size"] == size and content["mtime"] == mtime:
+
+                summary = {"counts"    : unpair (content["counts"]),
+                           "pixelArea" : content["pixelArea"],
+                           "areas"     : unpair (content["areas"])}
+                result = summary, content["nodata"]
+
+        return result
@@ -1,10 +1,11 @@
 from RasterUtils import RasterUtils
+from HistogramSidecar import HistogramSidecar
+from FileStaging import FileStaging
 
 from osgeo import gdalconst as GConst  
 from osgeo import gdal 
 
 import numpy as NPy 
-import shutil
 
 from typing import Union 
 
@@ -35,15 +36,28 @@ class PreferredValue:
         prefData = prefBand.ReadAsArray ()
         prefIn = None
 
-        mask = (prefData == self.PreferredValue)
-        inData[mask] = self.PreferredValue
+        inData = self.apply (inData, prefData)
 
-        shutil.copy (inputf, outputf)
+        FileStaging.stage (inputf, outputf, mutable = True)
         dsOut = gdal.Open (outputf, GConst.GA_Update)
         outBand = dsOut.GetRasterBand (1)
         outBand.WriteArray (inData)
         dsOut = None  
 
+        HistogramSidecar.fromArray (outputf, inData)
+
+    def apply (self, inData: NPy.ndarray, prefData: NPy.ndarray) -> NPy.ndarray:
+        ''' force the preferred value on pixels in memory 
+
+            @param inData: original pixels (modified in place) 
+            @param prefData: pixels locating the preferred value 
+            @return: resulting pixels '''
+
+        mask = (prefData == self.PreferredValue)
+        inData[mask] = self.PreferredValue
+
+        return inData
+
 # ----------------------------------- MAIN ----------------------------------
 
 import sys 
@@ -1,27 +1,37 @@
 #!/usr/bin/env python3 
 
 import os 
+import sys
 import shutil
+import tarfile
 
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 # from Utils.TmpFileUtils import TmpFileUtils
 from RasterUtils import RasterUtils
+from HistogramSidecar import HistogramSidecar
 
 from CLUIdentifier import CLUIdentifier
 from CLURasterizer2 import CLURasterizer2
 from CLUCalculator import CLUCalculator
 from CLUResultMerge import CLUResultMerge
+from VectorFormat import VectorFormat
+from FileStaging import FileStaging
 
 from PreferredValue import PreferredValue
 
 from ProductFinalizer import ProductFinalizer
+from StagePipeline import StagePipeline
+from StageManifest import StageManifest
+from RasterHandoff import RasterHandoff
+from SharedRaster import SharedRaster
 from BeanCounter import BeanCounter
 
 from MultiColorSweep import MultiColorSweep
 from CoreFill import CoreFill
 
-from typing import Union 
+from typing import Dict, Iterable, Union 
 
 from osgeo import gdalconst as GConst 
 from osgeo import gdal 
@@ -39,6 +49,36 @@ class ProcessRegion:
     PRODUCT_RESOLUTION_Y    = 30
 
     NO_VALUE_REPLACEMENT    = 0
+    PRIORITY_COLOR          = 0
+
+    MANIFEST_FMT            = "{region}.manifest.json"
+
+    STORE_MODES             = [(STORE_COPY := "copy"),     # duplicate the work files
+                               (STORE_LINK := "link"),     # hard link or reflink them (no extra space)
+                               (STORE_MOVE := "move")]     # move them (the work files are gone)
+
+    STORE_SUBDIRS           = ["clean", 
+                               "merged", 
+                               "product", 
+                               "results", 
+                               "swept", 
+                               "workdir",
+                               "adjusted"]
+
+    STORE_TMP_SUFFIX        = ".tmp"
+    STORE_OLD_SUFFIX        = ".old"
+    ARCHIVE_EXT             = ".tar.gz"
+    ARCHIVE_LEVEL           = 1         # LZW rasters hardly compress further, favor speed
+
+    # stages whose results can be handed over in memory
+    MEMORY_STAGES           = ["merge", "adjust"]
+
+    # stages whose outputs are decoded into shared memory (besides the basemap)
+    SHARED_STAGES           = ["rasterize"]
+
+    Stage = namedtuple ("Stage", "name resource method inputs params outputs")
+
+    PRODUCT_PROFILE         = ProductFinalizer.PROFILE_GTIFF
 
     def __init__ (self, region: str, 
                         datapath: str, 
@@ -48,7 +88,12 @@ class ProcessRegion:
                         dataskew: BeanCounter = None,
                         clufmt: str = CLU_FMT,
                         mapfmt: str = MAP_FMT,
-                        regionfmt: str = REG_FMT):
+                        regionfmt: str = REG_FMT,
+                        profile: str = PRODUCT_PROFILE,
+                        incremental: bool = False,
+                        inmemory: bool = False,
+                        materialize: Iterable[str] = (),
+                        shared: bool = False):
 
 
         ''' initializer 
@@ -58,16 +103,32 @@ class ProcessRegion:
             @param datapath: where the pixel data are 
             @param workpath: where the intermediate files go
             @param dataskew: if not None, run the dataskew analysis 
-            @param clufmt: filename format for CLUs 
+            @param clufmt: filename format for CLUs (shapefile, GeoPackage or 
+                           FlatGeobuf; another of these formats is used when 
+                           the named file does not exist) 
             @param mapfmt: filename format for basemaps 
-            @paraself.TAreaDistsm regionfmt: filename format for regions '''
+            @paraself.TAreaDistsm regionfmt: filename format for regions 
+            @param profile: product layout (see ProductFinalizer.PROFILES) 
+            @param incremental: if True, keep the work files and rebuild only 
+                                the stages whose inputs or parameters changed 
+            @param inmemory: if True, the merged and adjusted maps are passed 
+                             to the next stage as arrays instead of files 
+            @param materialize: in-memory stages (of MEMORY_STAGES) whose 
+                                results are still written to their files, 
+                                e.g. for debugging or for the store 
+            @param shared: if True, the basemap and the CLU raster are decoded 
+                           once into shared memory, for stages that hand 
+                           them to worker processes (see sharedRasters) '''
+
+        if incremental and inmemory:
+            raise ValueError ("Incremental runs need the stage files, they cannot run in memory")
 
         self.CluFormat = clufmt
         self.RegionFormat = regionfmt
         self.MapFormat = mapfmt 
 
         self.CLUFile = self.CluFormat.format (region = region.lower ())
-        self.CLUFile = os.path.join (clupath, self.CLUFile)
+        self.CLUFile = VectorFormat.locate (os.path.join (clupath, self.CLUFile))
 
         self.DataSkewAnalyzer = dataskew
 
@@ -91,6 +152,7 @@ class ProcessRegion:
         self.AdjustedPath = os.path.join (workParent, "adjusted")
 
         self.MCQFilterUse = mcqfilter
+        self.ProductProfile = profile
 
         for dirpath in [self.WorkPath, 
                         self.ResultPath, 
@@ -100,10 +162,20 @@ class ProcessRegion:
                         self.MergePath,
                         self.AdjustedPath]:
 
-            if os.path.exists (dirpath):
+            if os.path.exists (dirpath) and not incremental:
                 shutil.rmtree (dirpath)
 
-            os.makedirs (dirpath)
+            os.makedirs (dirpath, exist_ok = True)
+
+        self.Manifest = None
+        self.Handoff = RasterHandoff (self.MapFile, region.upper ()) if inmemory else None
+        self.Materialize = set (materialize)
+        self.Sharing = shared
+        self.Shared: Dict[str, SharedRaster] = {}
+
+        if incremental:
+            manifest = self.MANIFEST_FMT.format (region = region.upper ())
+            self.Manifest = StageManifest (os.path.join (self.WorkParent, manifest))
 
     def getNoDataValue (self) -> Union[int, float]:
         ''' find out what is no-data value for this particular basemap '''
@@ -126,30 +198,192 @@ class ProcessRegion:
         ds = None 
 
     def process (self): 
-        ''' perform the processing '''
+        ''' perform the processing; each stage holds a slot of its resource 
+            class when run in a StagePipeline; in incremental mode, stages 
+            whose fingerprint did not change since their last build are skipped '''
 
         self.NoDataValue = self.getNoDataValue ()
-        hasCLUs = os.path.exists (self.CLUFile)
-
-        if hasCLUs:
-            self.identifyCLUs ()
-            self.rasterizeCLUs ()
-            self.aggregateCLUs ()
-            self.rasterizeAggregate ()
-            self.scatterCleanup ()
-            self.resultMerge ()
+        self.planPaths ()
+
+        try:
+            if self.Sharing == True:
+                StagePipeline.runStage (StagePipeline.IO, self.share, self.MapFile)
+
+            for stage in self.stages ():
+                if self.Manifest is None or stage.inputs is None:
+                    StagePipeline.runStage (stage.resource, stage.method)
+                    self.shareOutputs (stage)
+                    continue
+
+                fingerprint = self.Manifest.fingerprint (stage.name, stage.inputs, stage.params)
+
+                if self.Manifest.isCurrent (stage.name, fingerprint, stage.outputs):
+                    sys.stdout.write (f" -> {self.Region.upper ()}: {stage.name} is up to date\n")
+                else:
+                    self.Manifest.invalidate (stage.name)
+                    self.removeOutputs (stage.outputs)
+                    StagePipeline.runStage (stage.resource, stage.method)
+                    self.Manifest.record (stage.name, fingerprint, stage.outputs)
+
+                self.shareOutputs (stage)
+
+        finally:
+            if self.Handoff is not None:
+                self.Handoff.release ()
+
+            self.releaseShared ()
+
+    def share (self, filename: str) -> SharedRaster:
+        ''' decode a raster of this region into shared memory (once); an 
+            in-memory handoff uses the shared pixels instead of reading them 
+
+            @param filename: raster on the region grid 
+            @return: shared raster, owned by this region '''
+
+        if filename not in self.Shared:
+            key = self.Region.lower () + "_" + str (len (self.Shared))
+            shared = SharedRaster.create (filename, key)
+            self.Shared[filename] = shared
+
+            if self.Handoff is not None:
+                self.Handoff.adopt (filename, shared.Data, shared.gdalType (), 
+                                    shared.Descriptor.noDataValue)
+
+        return self.Shared[filename]
+
+    def shareOutputs (self, stage):
+        ''' share the raster outputs of a stage listed in SHARED_STAGES '''
+
+        if self.Sharing == True and stage.name in self.SHARED_STAGES:
+            for output in stage.outputs:
+                StagePipeline.runStage (StagePipeline.IO, self.share, output)
+
+    def sharedRasters (self) -> Dict[str, SharedRaster.Descriptor]:
+        ''' descriptors of the shared rasters, to pass to worker processes 
+            (which attach with SharedRaster.attach and close when done) 
+
+            @return: {file : descriptor} '''
+
+        return {filename : shared.Descriptor for filename, shared in self.Shared.items ()}
+
+    def releaseShared (self):
+        ''' free the shared memory of the region (after the handoff let go 
+            of its views) '''
+
+        for shared in self.Shared.values ():
+            shared.unlink ()
+
+        self.Shared = {}
+
+    def stages (self):
+        ''' the stage graph of this region in order of execution: resource 
+            class each stage mostly uses, files it reads (None for stages that 
+            always run), parameters its result depends on and files it writes 
+
+            @return: list of Stage records '''
+
+        CPU = StagePipeline.CPU
+        IO = StagePipeline.IO
+
+        cleanupResource = CPU if self.MCQFilterUse == True else IO
+        sweepParams = {"mcqfilter" : self.MCQFilterUse, 
+                       "minsize"   : self.MIN_CLUSTER_SIZE}
+        productParams = {"xres"    : self.PRODUCT_RESOLUTION_X, 
+                         "yres"    : self.PRODUCT_RESOLUTION_Y,
+                         "profile" : self.ProductProfile,
+                         "nvreplace" : self.NO_VALUE_REPLACEMENT}
+
+        cleanMap, aggregate = self.cleanMapName ()
+
+        if os.path.exists (self.CLUFile):
+            result = [self.Stage ("identify",  IO,  self.identifyCLUs, None, {}, [self.CLUFile]),
+                      self.Stage ("rasterize", IO,  self.rasterizeCLUs, 
+                                  [self.CLUFile, self.MapFile], 
+                                  {"command" : CLURasterizer2.CMD_FMT}, 
+                                  [self.RasterizedCLUs]),
+                      self.Stage ("aggregate", CPU, self.aggregateCLUs, 
+                                  [self.MapFile, self.RasterizedCLUs, self.CLUFile], {}, 
+                                  [aggregate]),
+                      self.Stage ("clean",     IO,  self.rasterizeAggregate, 
+                                  [aggregate, self.MapFile], 
+                                  {"command" : CLURasterizer2.CMD_FMT, 
+                                   "field"   : CLUCalculator.MAJORITY_CROP_FIELD}, 
+                                  [cleanMap]),
+                      self.Stage ("sweep",     cleanupResource, self.scatterCleanup, 
+                                  [self.MapFile], sweepParams, [self.MapFileClean]),
+                      self.Stage ("merge",     CPU, self.resultMerge, 
+                                  [cleanMap, self.MapFileClean, self.RasterizedCLUs], {}, 
+                                  [self.MergedMap])]
         else:
-            self.scatterCleanup ()
+            result = [self.Stage ("sweep",     cleanupResource, self.scatterCleanup, 
+                                  [self.MapFile], sweepParams, [self.MapFileClean]),
+                      self.Stage ("merge",     IO,  self.copySwept, 
+                                  [self.MapFileClean], {}, [self.MergedMap])]
+
+        result += [self.Stage ("adjust",  CPU, self.finalAdjust, 
+                               [self.MergedMap, self.MapFile], {"priority" : self.PRIORITY_COLOR}, 
+                               [self.AdjustedMap]),
+                   self.Stage ("product", IO,  self.finalProduct, 
+                               [self.AdjustedMap], productParams, [self.ProductMap])]
+
+        return result 
+
+    def planPaths (self):
+        ''' name the files of all stages up front, so that stages can be 
+            skipped without losing track of their outputs '''
+
+        mapName = self.baseMapName ()
+
+        clufile = os.path.basename (self.CLUFile)
+        name, _ext = os.path.splitext (os.path.join (self.WorkPath, clufile))
+        self.RasterizedCLUs = name + "-clu.tif"
+
+        name, ext = os.path.splitext (os.path.basename (self.MapFile))
+        self.MapFileClean = os.path.join (self.SweptMapPath, name[0:2].lower () + ext)
+
+        self.MergedMap = os.path.join (self.MergePath, mapName)
+        self.AdjustedMap = os.path.join (self.AdjustedPath, mapName)
+        self.ProductMap = os.path.join (self.ProductPath, mapName)
+
+    def removeOutputs (self, outputs):
+        ''' delete stale outputs of a stage that is about to be rebuilt '''
+
+        for output in outputs:
+            if output == self.CLUFile or not os.path.exists (output):
+                continue
+
+            _root, ext = os.path.splitext (output)
+            if ext.lower () in VectorFormat.EXTENSIONS:
+                VectorFormat.remove (output)
+            else:
+                os.remove (output)
+
+            if os.path.exists (HistogramSidecar.name (output)):
+                os.remove (HistogramSidecar.name (output))
+
+    def copySwept (self):
+        ''' use the swept map as the merged map (region without CLUs) '''
+
+        mapName = self.baseMapName ()
+        sweptMap = os.path.join (self.SweptMapPath, mapName)
+        self.MergedMap = os.path.join (self.MergePath, mapName)
+        
+        if self.Handoff is not None:
+            self.Handoff.put ("merge", self.Handoff.read (sweptMap), like = sweptMap)
+            self.Handoff.release ([sweptMap])
+            self.handOver ("merge", self.MergedMap)
+        else:
+            FileStaging.stage (sweptMap, self.MergedMap)
+            HistogramSidecar.copy (sweptMap, self.MergedMap)
+
+    def handOver (self, stage: str, filename: str):
+        ''' write the in-memory result of a stage to its file, if requested 
 
-            mapName = self.baseMapName ()
-            sweptMap = os.path.join (self.SweptMapPath, mapName)
-            self.MergedMap = os.path.join (self.MergePath, mapName)
-            
-            shutil.copy (sweptMap, self.MergedMap)
+            @param stage: stage name (one of MEMORY_STAGES) 
+            @param filename: file of the stage result '''
 
-        self.finalAdjust ()
-        self.finalProduct ()
-        self.nvReplace (self.ProductMap, self.NO_VALUE_REPLACEMENT) 
+        if stage in self.Materialize:
+            self.Handoff.materialize (stage, filename)
 
     def finalAdjust (self):
         ''' perform the adjustment of uncultivated areas for better match 
@@ -158,22 +392,40 @@ class ProcessRegion:
         self.AdjustedMap = os.path.join (self.AdjustedPath, 
                                          self.baseMapName ())
 
-        pv = PreferredValue ((PRIORITY_COLOR := 0))
-        pv.process (self.MergedMap, self.AdjustedMap, self.MapFile)
+        pv = PreferredValue (self.PRIORITY_COLOR)
+
+        if self.Handoff is not None:
+            adjusted = pv.apply (self.Handoff.get ("merge"), self.Handoff.read (self.MapFile))
+            self.Handoff.put ("adjust", adjusted, like = "merge")
+            self.Handoff.release (["merge", self.MapFile])
+            self.handOver ("adjust", self.AdjustedMap)
+        else:
+            pv.process (self.MergedMap, self.AdjustedMap, self.MapFile)
 
     def resultMerge (self):
         ''' merge the cleaned (vector based) map with the pixel data '''
 
-        clumg = CLUResultMerge (self.CleanMapPath,
-                                self.SweptMapPath,
-                                self.WorkPath,
-                                self.MergePath)
-
-        clumg.merge ()
-
         self.MergedMap = os.path.join (self.MergePath, 
                                        self.baseMapName ())
 
+        if self.Handoff is not None:
+            cleanMap, _aggregate = self.cleanMapName ()
+            merged = CLUResultMerge.combine (self.Handoff.read (cleanMap),
+                                             self.Handoff.read (self.RasterizedCLUs),
+                                             self.Handoff.read (self.MapFileClean))
+
+            self.Handoff.put ("merge", merged, like = self.MapFileClean)
+            self.Handoff.release ([cleanMap, self.RasterizedCLUs, self.MapFileClean])
+            self.handOver ("merge", self.MergedMap)
+
+        else:
+            clumg = CLUResultMerge (self.CleanMapPath,
+                                    self.SweptMapPath,
+                                    self.WorkPath,
+                                    self.MergePath)
+
+            clumg.merge ()
+
     def baseMapName (self) -> str:
         ''' basic name for file with a map 
 
@@ -182,14 +434,20 @@ class ProcessRegion:
         return self.RegionFormat.format (region = self.Region.lower ())
 
     def finalProduct (self):
-        ''' finalize the product's resolution and projection '''
+        ''' finalize the product's resolution and projection; no-data pixels
+            are replaced as part of the resampling, before the product is 
+            published in its final layout '''
 
         mapName = self.baseMapName ()
         self.ProductMap = os.path.join (self.ProductPath, mapName)
-        pf = ProductFinalizer (source = self.AdjustedMap, 
+        source = self.AdjustedMap if self.Handoff is None else self.Handoff.materialize ("adjust")
+
+        pf = ProductFinalizer (source = source, 
                                product = self.ProductMap,
                                xres = self.PRODUCT_RESOLUTION_X,
-                               yres = self.PRODUCT_RESOLUTION_Y)
+                               yres = self.PRODUCT_RESOLUTION_Y,
+                               profile = self.ProductProfile,
+                               nvreplace = self.NO_VALUE_REPLACEMENT)
         pf.process ()
 
     def cleanMapName (self):
@@ -234,9 +492,11 @@ class ProcessRegion:
                                        minSize = self.MIN_CLUSTER_SIZE,
                                        ignorenv = True)
                 mcs.sweep ()
+                HistogramSidecar.fromFile (self.MapFileClean)
 
         else:
-            shutil.copy (self.MapFile, self.MapFileClean)
+            FileStaging.stage (self.MapFile, self.MapFileClean)
+            HistogramSidecar.copy (self.MapFile, self.MapFileClean)
         
     def identifyCLUs (self):
         ''' assign each CLU a unique identifier '''
@@ -274,31 +534,99 @@ class ProcessRegion:
                                  limit = None) 
         cluCalc.calculate ()
 
-    def store (self):
-        ''' store all valuable results ''' 
+    def store (self, storepath: str = None, 
+                     mode: str = STORE_COPY, 
+                     archive: Iterable[str] = ()):
+
+        ''' store all valuable results; the region directory is assembled 
+            next to its final place and swapped in when complete, so the 
+            store never holds a partial region 
+
+            @param storepath: where the results of all regions are stored 
+                              (production directory next to the work files by default) 
+            @param mode: how files get into the store, one of STORE_MODES 
+                         (link falls back to copying across file systems) 
+            @param archive: subdirectories stored as compressed tar archives 
+                            (built in parallel) instead of directories ''' 
+
+        if mode not in self.STORE_MODES:
+            raise ValueError (f"Unknown store mode '{mode}'")
+
+        if mode == self.STORE_MOVE and self.Manifest is not None:
+            raise ValueError ("Incremental runs keep their stage files, they cannot be moved to the store")
+
+        if storepath is None:
+            storepath = os.path.join (self.WorkParent, "production")
+
+        storedir = os.path.join (storepath, self.Region.upper ())
+        tmpdir = storedir + self.STORE_TMP_SUFFIX
+        olddir = storedir + self.STORE_OLD_SUFFIX
+
+        if os.path.exists (olddir) and not os.path.exists (storedir):
+            os.rename (olddir, storedir)        # swap of an earlier store was interrupted
+
+        for d in [tmpdir, olddir]:
+            if os.path.exists (d):
+                shutil.rmtree (d)
+        os.makedirs (tmpdir)
+
+        archive = [sd for sd in self.STORE_SUBDIRS if sd in archive]
+
+        with ThreadPoolExecutor (max_workers = max (1, len (archive))) as executor:
+            archives = [executor.submit (self.archiveDir, 
+                                         os.path.join (self.WorkParent, sd),
+                                         os.path.join (tmpdir, sd + self.ARCHIVE_EXT))
+                        for sd in archive]
+
+            for sd in self.STORE_SUBDIRS:
+                if sd not in archive:
+                    self.storeDir (os.path.join (self.WorkParent, sd), 
+                                   os.path.join (tmpdir, sd), mode)
+
+            for future in archives:
+                future.result ()
+
+        if mode == self.STORE_MOVE:
+            for sd in archive:
+                shutil.rmtree (os.path.join (self.WorkParent, sd))
+                os.mkdir (os.path.join (self.WorkParent, sd))
 
-        storedir = os.path.join (self.WorkParent, "production", self.Region.upper ())
         if os.path.exists (storedir):
-            shutil.rmtree (storedir) 
-        os.makedirs (storedir)
-        
-        SUBDIRS = ["clean", 
-                   "merged", 
-                   "product", 
-                   "results", 
-                   "swept", 
-                   "workdir",
-                   "adjusted"]
-                   
-        for sd in SUBDIRS:
-            sourceDir = os.path.join (self.WorkParent, sd)
-            targetDir = os.path.join (storedir, sd)
-            os.mkdir (targetDir)
-            
-            files = os.listdir (sourceDir)
-            for f in files:
-                sourceFile = os.path.join (sourceDir, f)
-                shutil.copy (sourceFile, targetDir)
+            os.rename (storedir, olddir)
+        os.rename (tmpdir, storedir)
+
+        if os.path.exists (olddir):
+            shutil.rmtree (olddir)
+
+    def storeDir (self, sourceDir: str, targetDir: str, mode: str):
+        ''' put the files of a work directory into the store 
+
+            @param sourceDir: work directory 
+            @param targetDir: its directory in the store 
+            @param mode: one of STORE_MODES '''
+
+        os.mkdir (targetDir)
+
+        for f in os.listdir (sourceDir):
+            sourceFile = os.path.join (sourceDir, f)
+            targetFile = os.path.join (targetDir, f)
+
+            if mode == self.STORE_MOVE:
+                shutil.move (sourceFile, targetFile)
+            elif mode == self.STORE_LINK:
+                FileStaging.stage (sourceFile, targetFile, durable = True)
+            else:
+                shutil.copy (sourceFile, targetFile)
+
+    def archiveDir (self, sourceDir: str, archive: str):
+        ''' pack a work directory into a compressed tar archive 
+
+            @param sourceDir: work directory 
+            @param archive: archive file '''
+
+        with tarfile.open (archive, "w:gz", compresslevel = self.ARCHIVE_LEVEL) as tar:
+            for f in sorted (os.listdir (sourceDir)):
+                tar.add (os.path.join (sourceDir, f), arcname = f)
 
     def nvReplace (self, datafile: str, replacement: Union[float, int]):
         ''' replace the no-value pixels with pixels of set value 
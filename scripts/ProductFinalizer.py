@@ -1,4 +1,16 @@
 import os 
+import shlex
+
+from typing import List, Optional, Union
+
+from BlockReducer import BlockReducer
+from RasterUtils import RasterUtils
+from HistogramSidecar import HistogramSidecar
+from FileStaging import FileStaging
+
+from osgeo import gdalconst as GConst 
+from osgeo import gdal 
+from osgeo import osr 
 
 class ProductFinalizer:
     ''' performs final reprojection and scaling '''
@@ -7,15 +19,36 @@ class ProductFinalizer:
     DEFAULT_YRES            = 10
     DEFAULT_PROJECTION      = "+proj=aea +lat_1=29.5 +lat_2=45.5 +lat_0=23 +lon_0=-96 +x_0=0 +y_0=0 +ellps=GRS80 +datum=NAD83 +towgs84=0,0,0,0,0,0,0 +units=m +no_defs"
     DEFAULT_OPTIONS         = "-co COMPRESS=LZW -co TILED=YES -r near -q"
+    DEFAULT_RESAMPLING      = "near"
 
     CMD_FMT                 = 'gdalwarp -tr {xres} {yres} -t_srs "{proj}" {opts} {inp} {out}'
+    WARP_OPTS_FMT           = '-tr {xres} {yres} -t_srs "{proj}" {opts}'
+    VSIMEM_PREFIX           = "/vsimem/"
+    NVREPLACE_FMT           = " -dstnodata None -init {value}"
+
+    PROFILES                = [(PROFILE_GTIFF := "gtiff"),
+                               (PROFILE_COG   := "cog")]
+
+    DEFAULT_OVR_RESAMPLING  = "MODE"
+    RESAMPLING_ITEM         = "RESAMPLING"      # band metadata naming the overview resampling
+    DEFAULT_THREADS         = "ALL_CPUS"
+    OVERVIEW_MIN_SIZE       = 256       # stop adding overview levels below this size
+    COG_BLOCK_SIZE          = 512
+
+    GRID_TOLERANCE          = 1e-9      # relative tolerance for resolution ratios
+    STRIP_ROWS              = 2048      # source rows per strip in the block reducer
 
     def __init__ (self, *, source: str, 
                            product: str,
                            xres: float = DEFAULT_XRES,
                            yres: float = DEFAULT_YRES,
                            options: str = DEFAULT_OPTIONS,
-                           proj4: str = DEFAULT_PROJECTION):
+                           proj4: str = DEFAULT_PROJECTION,
+                           fastpath: bool = True,
+                           profile: str = PROFILE_GTIFF,
+                           ovrresampling: str = DEFAULT_OVR_RESAMPLING,
+                           threads: str = DEFAULT_THREADS,
+                           nvreplace: Union[int, float, None] = None):
 
         ''' initializer 
 
@@ -24,7 +57,13 @@ class ProductFinalizer:
             @param xres: X-resolution
             @param yres: Y-resolution 
             @param options: additional processing options 
-            @param proj4: target projection string ''' 
+            @param proj4: target projection string 
+            @param fastpath: if True, skip warping for sources already on the target grid
+            @param profile: product layout, one of PROFILES
+            @param ovrresampling: overview resampling for the COG profile (MODE or NEAREST)
+            @param threads: threads for overviews and compression (number or ALL_CPUS)
+            @param nvreplace: if not None, no-data pixels of the product are set to this 
+                              value and the no-data declaration is removed '''
 
         self.Source = source 
         self.Product = product 
@@ -32,21 +71,283 @@ class ProductFinalizer:
         self.YRes = yres
         self.Options = options
         self.Projection = proj4
+        self.FastPath = fastpath
+        self.OverviewResampling = ovrresampling
+        self.Threads = str (threads)
+        self.NoValueReplacement = nvreplace
+
+        if profile not in self.PROFILES:
+            raise ValueError (f"Unknown product profile '{profile}'")
+
+        self.Profile = profile
 
     def process (self):
         ''' perform the final production steps '''
 
+        self.resample ()
+        self.publish ()
+        self.emitSidecar ()
+
+    def resample (self):
+        ''' bring the source to the target projection and resolution '''
+
         if os.path.exists (self.Product):
             os.unlink (self.Product)
 
-        cmd = self.CMD_FMT.format (xres = self.XRes, 
-                                   yres = self.YRes,
-                                   inp = self.Source,
-                                   out = self.Product,
-                                   proj = self.Projection,
-                                   opts = self.Options)
+        self.Counts = None
+        factor = self.gridFactor () if self.FastPath else None
+
+        if factor == 1:
+            self.copy ()
+        elif factor is not None:
+            self.reduce (factor)
+        else:
+            self.warp ()
+
+    def emitSidecar (self):
+        ''' write the histogram sidecar of the finished product, from the 
+            counts collected while writing if there are any '''
+
+        if self.Counts is not None:
+            HistogramSidecar.fromCounts (self.Product, self.Counts)
+        else:
+            HistogramSidecar.fromFile (self.Product)
+
+    def publish (self):
+        ''' convert the resampled product to the requested profile '''
+
+        if self.Profile == self.PROFILE_COG:
+            self.makeCOG ()
+
+    def makeCOG (self):
+        ''' rewrite the product as a Cloud-Optimized GeoTIFF with internal
+            overviews; the overview levels are computed by GDAL worker threads '''
+
+        previous = gdal.GetConfigOption ("GDAL_NUM_THREADS")
+        gdal.SetConfigOption ("GDAL_NUM_THREADS", self.Threads)
+
+        root, ext = os.path.splitext (self.Product)
+        cogFile = root + "-cog" + ext
+
+        try:
+            ds = gdal.Open (self.Product, GConst.GA_Update)
+            ds.BuildOverviews (self.OverviewResampling, self.overviewLevels (ds))
+            # record how the overviews were built; area estimates only use 
+            # nearest-sampled ones (see AreaCounter.isNearest)
+            ds.GetRasterBand (1).SetMetadataItem (self.RESAMPLING_ITEM, self.OverviewResampling.upper ())
+            ds = None
+
+            wanted = dict (co.split ("=", 1) for co in self.creationOptions ())
+            options = ["COMPRESS=" + wanted.get ("COMPRESS", "LZW"),
+                       "NUM_THREADS=" + self.Threads,
+                       "BLOCKSIZE=" + str (self.COG_BLOCK_SIZE),
+                       "OVERVIEWS=FORCE_USE_EXISTING"]
+
+            gdal.Translate (cogFile, self.Product, format = "COG",
+                            creationOptions = options)
+            os.replace (cogFile, self.Product)
+
+        finally:
+            gdal.SetConfigOption ("GDAL_NUM_THREADS", previous)
+
+            if os.path.exists (cogFile):
+                os.unlink (cogFile)
+
+    def overviewLevels (self, dataset) -> List[int]:
+        ''' overview decimation factors down to OVERVIEW_MIN_SIZE
+
+            @param dataset: dataset to build overviews for
+            @return: list of factors (2, 4, 8, ...) '''
+
+        levels = []
+        level = 2
+        size = max (dataset.RasterXSize, dataset.RasterYSize)
+
+        while size // level >= self.OVERVIEW_MIN_SIZE:
+            levels.append (level)
+            level *= 2
+
+        return levels
+
+    def warp (self):
+        ''' full reprojection and resampling through gdalwarp; no-data 
+            replacement is folded into the warp as the destination init value;
+            in-memory sources are warped in this process '''
+
+        options = self.Options
+        if self.NoValueReplacement is not None:
+            options += self.NVREPLACE_FMT.format (value = self.NoValueReplacement)
+
+        if self.Source.startswith (self.VSIMEM_PREFIX):
+            warpOptions = self.WARP_OPTS_FMT.format (xres = self.XRes, 
+                                                     yres = self.YRes,
+                                                     proj = self.Projection,
+                                                     opts = options)
+            ds = gdal.Warp (self.Product, self.Source, options = warpOptions)
+            ds = None
+
+        else:
+            cmd = self.CMD_FMT.format (xres = self.XRes, 
+                                       yres = self.YRes,
+                                       inp = self.Source,
+                                       out = self.Product,
+                                       proj = self.Projection,
+                                       opts = options)
+
+            os.system (cmd)
+
+    def copy (self):
+        ''' source is already on the target grid; copy it verbatim if it is
+            stored the way the warp would store it, otherwise re-encode it 
+            without any resampling '''
+
+        ds = gdal.Open (self.Source, GConst.GA_ReadOnly)
+        band = ds.GetRasterBand (1)
+        compression = ds.GetMetadataItem ("COMPRESSION", "IMAGE_STRUCTURE")
+        tiled = band.GetBlockSize ()[0] < band.XSize
+
+        wanted = dict (co.split ("=", 1) for co in self.creationOptions ())
+        sameStorage = ds.GetDriver ().ShortName == "GTiff" and \
+                      not self.Source.startswith (self.VSIMEM_PREFIX) and \
+                      (compression or "").upper () == wanted.get ("COMPRESS", "").upper () and \
+                      tiled == (wanted.get ("TILED", "NO").upper () == "YES")
+
+        if sameStorage:
+            ds = None
+            # the product is a deliverable that gets edited later (no-data 
+            # replacement, COG overviews, callers): never share the source inode
+            FileStaging.stage (self.Source, self.Product, mutable = True)
+        else:
+            gdal.Translate (self.Product, ds, format = "GTiff",
+                            creationOptions = self.creationOptions ())
+            ds = None
+
+        if self.NoValueReplacement is not None:
+            RasterUtils.undeclareNoDataValue (self.Product, self.NoValueReplacement)
+
+    def reduce (self, factor: int):
+        ''' integer-factor downsampling on an aligned grid, strip by strip 
+
+            @param factor: downsampling factor '''
+
+        src = gdal.Open (self.Source, GConst.GA_ReadOnly)
+        xOrig, xStep, _xrot, yOrig, _yrot, yStep = src.GetGeoTransform ()
+
+        driver = gdal.GetDriverByName ("GTiff")
+        dst = driver.Create (self.Product, 
+                             src.RasterXSize // factor, 
+                             src.RasterYSize // factor,
+                             src.RasterCount, 
+                             src.GetRasterBand (1).DataType,
+                             options = self.creationOptions ())
+        dst.SetGeoTransform ((xOrig, xStep * factor, 0, yOrig, 0, yStep * factor))
+        dst.SetProjection (src.GetProjection ())
+
+        stripRows = factor * max (1, self.STRIP_ROWS // factor)
+        self.Counts = {}
+
+        for iBand in range (1, src.RasterCount + 1):
+            srcBand = src.GetRasterBand (iBand)
+            dstBand = dst.GetRasterBand (iBand)
+            noDataValue = srcBand.GetNoDataValue ()
+
+            replace = noDataValue is not None and self.NoValueReplacement is not None
+
+            if noDataValue is not None and not replace:
+                dstBand.SetNoDataValue (noDataValue)
+
+            reducer = BlockReducer (factor, self.resampling (), noDataValue)
+
+            for startRow in range (0, src.RasterYSize, stripRows):
+                nRows = min (stripRows, src.RasterYSize - startRow)
+                data = srcBand.ReadAsArray (0, startRow, src.RasterXSize, nRows)
+                data = reducer.reduce (data)
+
+                if replace:
+                    data[data == noDataValue] = self.NoValueReplacement
+
+                dstBand.WriteArray (data, 0, startRow // factor)
+
+                if iBand == 1:
+                    for value, n in RasterUtils.arrayHistogram (data).items ():
+                        self.Counts[value] = self.Counts.get (value, 0) + n
+
+        dst = None
+        src = None
+
+    def gridFactor (self) -> Optional[int]:
+        ''' check whether the source can skip the warp 
+
+            @return: 1 for identical grid, integer downsampling factor for 
+                     an aligned coarser grid, None if a warp is necessary '''
+
+        result = None
+
+        ds = gdal.Open (self.Source, GConst.GA_ReadOnly)
+        _xOrig, xStep, xRot, _yOrig, yRot, yStep = ds.GetGeoTransform ()
+        xSize = ds.RasterXSize
+        ySize = ds.RasterYSize
+        dataType = ds.GetRasterBand (1).DataType
+        
+        srcSRS = osr.SpatialReference ()
+        srcSRS.ImportFromWkt (ds.GetProjection ())
+        ds = None 
+
+        dstSRS = osr.SpatialReference ()
+        dstSRS.ImportFromProj4 (self.Projection)
+
+        if xRot == 0 and yRot == 0 and xStep > 0 and yStep < 0 and \
+           srcSRS.IsSame (dstSRS):
+
+            kx = self.XRes / xStep
+            ky = self.YRes / -yStep
+            factor = int (round (kx))
+
+            if factor >= 1 and \
+               abs (kx - factor) <= self.GRID_TOLERANCE * kx and \
+               abs (ky - factor) <= self.GRID_TOLERANCE * ky:
+
+                if factor == 1:
+                    result = factor
+                elif xSize % factor == 0 and ySize % factor == 0 and \
+                     self.canReduce (dataType):
+                    result = factor
+
+        return result 
+
+    def canReduce (self, dataType: int) -> bool:
+        ''' check whether the block reducer implements requested resampling 
+
+            @param dataType: GDAL data type of the source
+            @return: True if the block reducer can replace the warp '''
+
+        UNSIGNED_TYPES = [GConst.GDT_Byte, GConst.GDT_UInt16, GConst.GDT_UInt32]
+        resampling = self.resampling ()
+
+        return resampling == BlockReducer.NEAREST or \
+               (resampling == BlockReducer.MODE and dataType in UNSIGNED_TYPES)
+
+    def resampling (self) -> str:
+        ''' resampling method requested in the processing options '''
+
+        values = self.optionValues ("-r")
+
+        return values[-1] if values else self.DEFAULT_RESAMPLING
+
+    def creationOptions (self) -> List[str]:
+        ''' creation options requested in the processing options '''
+
+        return self.optionValues ("-co")
+
+    def optionValues (self, flag: str) -> List[str]:
+        ''' collect values of a given flag from the processing options 
+
+            @param flag: flag to look for (e.g. -co)
+            @return: list of values in order of appearance '''
+
+        tokens = shlex.split (self.Options)
 
-        os.system (cmd)
+        return [tokens[i + 1] for i in range (len (tokens) - 1) if tokens[i] == flag]
 
 # ................................. MAIN ....................................
 
@@ -57,20 +358,22 @@ import glob
 if __name__ == "__main__":
 
     REQUIRED_ARGS = 2
+    OPTIONAL_ARGS = 1
 
     args = sys.argv[1:]
     nArgs = len (args)
 
-    if nArgs == REQUIRED_ARGS:
-        inpdir, outdir = args 
+    if REQUIRED_ARGS <= nArgs <= REQUIRED_ARGS + OPTIONAL_ARGS:
+        inpdir, outdir = args[:REQUIRED_ARGS]
+        profile = args[REQUIRED_ARGS] if nArgs > REQUIRED_ARGS else ProductFinalizer.PROFILE_GTIFF
         fpattern = os.path.join (inpdir, "*.tif")
         files = glob.glob (fpattern)
 
         for f in files:
             product = os.path.join (outdir, os.path.basename (f))
-            pf = ProductFinalizer (source = f, product = product)
+            pf = ProductFinalizer (source = f, product = product, profile = profile)
             pf.process ()
 
     else:
         app = os.path.basename (sys.argv[0])
-        sys.stderr.write (f"\nUSAGE: [python3] {app} inpdir outdir\n\n")
\ No newline at end of file
+        sys.stderr.write (f"\nUSAGE: [python3] {app} inpdir outdir [gtiff|cog]\n\n")
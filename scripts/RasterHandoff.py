@@ -0,0 +1,144 @@
+from typing import Any, Dict, List, Optional
+
+from collections import namedtuple
+
+from osgeo import gdal
+from osgeo import gdal_array
+from osgeo import gdalconst as GConst
+
+import numpy as NPy
+
+from HistogramSidecar import HistogramSidecar
+
+class RasterHandoff:
+    ''' in-memory exchange of the stage rasters of a region: all of them are
+        on the grid of the region basemap, so a stage can pass its pixels to
+        the next one as an array and only the georeferencing is kept once.
+        Rasters written by external tools are read once and shared by all
+        stages that use them '''
+
+    VSIMEM_FMT          = "/vsimem/handoff/{key}/{name}.tif"
+    CREATION_OPTIONS    = ["COMPRESS=LZW", "TILED=YES"]
+
+    Raster = namedtuple ("Raster", "data dataType noDataValue")
+
+    def __init__ (self, template: str, key: str):
+        ''' initializer
+
+            @param template: raster with the grid of the region (basemap)
+            @param key: name of the region, keeps in-memory files of
+                        regions apart '''
+
+        ds = gdal.Open (template, GConst.GA_ReadOnly)
+        self.GeoTransform = ds.GetGeoTransform ()
+        self.Projection = ds.GetProjection ()
+        self.XSize = ds.RasterXSize
+        self.YSize = ds.RasterYSize
+        ds = None
+
+        self.Key = key
+        self.Rasters: Dict[str, Any] = {}
+        self.MemFiles: List[str] = []
+
+    def read (self, filename: str) -> NPy.ndarray:
+        ''' pixels of a raster file on the region grid, read on first use
+
+            @param filename: raster file
+            @return: first band '''
+
+        if filename not in self.Rasters:
+            ds = gdal.Open (filename, GConst.GA_ReadOnly)
+            band = ds.GetRasterBand (1)
+
+            if (ds.RasterXSize, ds.RasterYSize) != (self.XSize, self.YSize):
+                raise ValueError (f"{filename} is not on the grid of the region")
+
+            self.Rasters[filename] = self.Raster (band.ReadAsArray (), band.DataType, band.GetNoDataValue ())
+            ds = None
+
+        return self.Rasters[filename].data
+
+    def adopt (self, filename: str, data: NPy.ndarray, dataType: int, noDataValue):
+        ''' use pixels of a raster file that were already decoded elsewhere 
+            (e.g. into shared memory) instead of reading the file 
+
+            @param filename: raster file 
+            @param data: its first band (not modified by any stage) 
+            @param dataType: its GDAL data type 
+            @param noDataValue: its no-data value '''
+
+        self.Rasters[filename] = self.Raster (data, dataType, noDataValue)
+
+    def put (self, name: str, data: NPy.ndarray, like: str):
+        ''' keep the result of a stage; it is stored the way a copy of
+            another raster updated with the data would store it
+
+            @param name: name of the result
+            @param data: pixels
+            @param like: raster (name or file) whose data type and no-data value it takes '''
+
+        if like not in self.Rasters:
+            self.read (like)
+
+        template = self.Rasters[like]
+        dtype = NPy.dtype (gdal_array.GDALTypeCodeToNumericTypeCode (template.dataType))
+
+        if data.dtype != dtype:
+            if NPy.issubdtype (dtype, NPy.integer):
+                limits = NPy.iinfo (dtype)
+                data = NPy.clip (data, limits.min, limits.max)
+            data = data.astype (dtype)
+
+        self.Rasters[name] = self.Raster (data, template.dataType, template.noDataValue)
+
+    def get (self, name: str) -> NPy.ndarray:
+        ''' pixels of a kept result '''
+
+        return self.Rasters[name].data
+
+    def materialize (self, name: str, filename: Optional[str] = None) -> str:
+        ''' write a kept result as a GeoTIFF
+
+            @param name: name of the result
+            @param filename: file to write (with its histogram sidecar); None
+                             for an uncompressed in-memory file for GDAL based
+                             consumers
+            @return: file name '''
+
+        raster = self.Rasters[name]
+        inMemory = filename is None
+
+        if inMemory:
+            filename = self.VSIMEM_FMT.format (key = self.Key, name = name)
+            self.MemFiles.append (filename)
+
+        driver = gdal.GetDriverByName ("GTiff")
+        ds = driver.Create (filename, self.XSize, self.YSize, 1, raster.dataType,
+                            options = [] if inMemory else self.CREATION_OPTIONS)
+        ds.SetGeoTransform (self.GeoTransform)
+        ds.SetProjection (self.Projection)
+
+        band = ds.GetRasterBand (1)
+        if raster.noDataValue is not None:
+            band.SetNoDataValue (raster.noDataValue)
+        band.WriteArray (raster.data)
+        ds = None
+
+        if not inMemory:
+            HistogramSidecar.fromArray (filename, raster.data)
+
+        return filename
+
+    def release (self, names: Optional[List[str]] = None):
+        ''' drop rasters that are no longer needed
+
+            @param names: names or files to drop (None for all, including
+                          the in-memory files) '''
+
+        for name in names if names is not None else list (self.Rasters):
+            self.Rasters.pop (name, None)
+
+        if names is None:
+            for filename in self.MemFiles:
+                gdal.Unlink (filename)
+            self.MemFiles = []
@@ -1,17 +1,24 @@
-from typing import Union
+from typing import Dict, Iterator, Optional, Tuple, Union
 
-from osgeo import gdalconst as GConst 
+from osgeo import gdalconst as GConst
 from osgeo import gdal
 
+import numpy as NPy
+
 class RasterUtils:
-    ''' various common operations on raster maps ''' 
+    ''' various common operations on raster maps '''
+
+    MIN_WINDOW_PIXELS   = 1 << 20   # striped files are read in groups of strips at least this big
+    MAX_BINS            = 1 << 16   # largest value histogram counts with bincount
+
+    TWindow = Tuple[int, int, int, int]
 
-    @classmethod 
+    @classmethod
     def undeclareNoDataValue (clss, inputfile: str,
                                     replacement: Union[int, float, None] = None):
 
         ''' remove no data delcaration from raster and optionally replace
-            all no-data pixels with a fixed value 
+            all no-data pixels with a fixed value
 
             @param inputfile: raster to operate on (the result will overwrite input)
             @param replacement: replacement for no-data value '''
@@ -20,15 +27,148 @@ class RasterUtils:
 
         for iBand in range (1, ds.RasterCount + 1):
             band = ds.GetRasterBand (iBand)
-            
+
             if (ndv := band.GetNoDataValue ()) is not None:
                 band.DeleteNoDataValue ()
 
             if replacement is not None and ndv is not None:
-                data = band.ReadAsArray ()
-                data[data == ndv] = replacement
-                band.WriteArray (data)
+                clss.replaceValue (band, ndv, replacement)
 
         ds = None
 
-        
+    @classmethod
+    def replaceValue (clss, band, value: Union[int, float],
+                                  replacement: Union[int, float]) -> int:
+
+        ''' replace all pixels of given value, block by block; blocks that
+            do not contain the value are neither modified nor rewritten
+
+            @param band: raster band opened for update
+            @param value: value to replace
+            @param replacement: replacement value
+            @return: number of blocks rewritten '''
+
+        nRewritten = 0
+
+        for xOff, yOff, xSize, ySize in clss.blockWindows (band):
+            data = band.ReadAsArray (xOff, yOff, xSize, ySize)
+            mask = NPy.isnan (data) if NPy.isnan (value) else (data == value)
+
+            if mask.any ():
+                data[mask] = replacement
+                band.WriteArray (data, xOff, yOff)
+                nRewritten += 1
+
+        return nRewritten
+
+    @classmethod
+    def histogram (clss, band, 
+                         rowWeights: Optional[NPy.ndarray] = None) -> Dict[Union[int, float], Union[int, float]]:
+        ''' count pixels of every value in one streaming pass; integer data
+            are counted with bincount, anything else through unique
+
+            @param band: raster band
+            @param rowWeights: if given, sum these per-row weights (e.g. pixel 
+                               areas) instead of counting pixels 
+            @return: {value : pixel count or weight} for all values present, sorted by value '''
+
+        counts = NPy.zeros (0, dtype = NPy.int64 if rowWeights is None else NPy.float64)
+        others: Dict[Union[int, float], Union[int, float]] = {}
+
+        for xOff, yOff, xSize, ySize in clss.blockWindows (band):
+            data = band.ReadAsArray (xOff, yOff, xSize, ySize)
+            weights = None if rowWeights is None else rowWeights[yOff:yOff + ySize]
+            counts = clss.accumulate (counts, others, data, weights)
+
+        return clss.collect (counts, others)
+
+    @classmethod
+    def arrayHistogram (clss, data: NPy.ndarray, 
+                              rowWeights: Optional[NPy.ndarray] = None) -> Dict[Union[int, float], Union[int, float]]:
+        ''' same as histogram, for pixel data already in memory 
+
+            @param data: 2D array of pixels 
+            @param rowWeights: if given, sum these per-row weights instead of counting pixels 
+            @return: {value : pixel count or weight} for all values present, sorted by value '''
+
+        counts = NPy.zeros (0, dtype = NPy.int64 if rowWeights is None else NPy.float64)
+        others: Dict[Union[int, float], Union[int, float]] = {}
+        counts = clss.accumulate (counts, others, data, rowWeights)
+
+        return clss.collect (counts, others)
+
+    @classmethod
+    def accumulate (clss, counts: NPy.ndarray, 
+                          others: Dict, 
+                          data: NPy.ndarray, 
+                          rowWeights: Optional[NPy.ndarray]) -> NPy.ndarray:
+
+        ''' add a window of data to running counts 
+
+            @param counts: bincount accumulator (may be replaced by a longer one)
+            @param others: accumulator for values bincount cannot handle 
+            @param data: 2D window of pixels 
+            @param rowWeights: per-row weights of the window, or None 
+            @return: updated bincount accumulator '''
+
+        weights = None if rowWeights is None else NPy.repeat (rowWeights, data.shape[1])
+        data = data.ravel ()
+
+        if clss.isBinnable (data):
+            binned = NPy.bincount (data, weights = weights, minlength = counts.size)
+            if binned.size > counts.size:
+                counts = NPy.pad (counts, (0, binned.size - counts.size))
+            counts += binned
+        else:
+            values, inverse = NPy.unique (data, return_inverse = True)
+            sums = NPy.bincount (inverse.ravel (), weights = weights)
+            for value, n in zip (values.tolist (), sums.tolist ()):
+                others[value] = others.get (value, 0) + n
+
+        return counts
+
+    @classmethod
+    def collect (clss, counts: NPy.ndarray, others: Dict) -> Dict[Union[int, float], Union[int, float]]:
+        ''' merge the accumulators into a single sorted histogram '''
+
+        for value in NPy.flatnonzero (counts).tolist ():
+            others[value] = others.get (value, 0) + counts[value].item ()
+
+        return dict (sorted (others.items ()))
+
+    @classmethod
+    def isBinnable (clss, data: NPy.ndarray) -> bool:
+        ''' check whether data can be counted with a bincount of bounded size
+
+            @param data: pixel data
+            @return: True for non-negative integers below MAX_BINS '''
+
+        result = False
+
+        if data.dtype == NPy.uint8:
+            result = True
+        elif NPy.issubdtype (data.dtype, NPy.integer) and data.dtype != NPy.uint64:
+            result = data.size == 0 or (data.min () >= 0 and data.max () < clss.MAX_BINS)
+
+        return result
+
+    @classmethod
+    def blockWindows (clss, band, minPixels: int = MIN_WINDOW_PIXELS) -> Iterator[TWindow]:
+        ''' iterate over read windows aligned with the natural block layout
+            of the band; tiles are visited one by one, full-width strips are
+            grouped so that each window has at least minPixels pixels
+
+            @param band: raster band
+            @param minPixels: minimum window size for striped layouts
+            @return: iterator of (xoff, yoff, xsize, ysize) windows '''
+
+        blockX, blockY = band.GetBlockSize ()
+        xSize = band.XSize
+        ySize = band.YSize
+
+        if blockX >= xSize:
+            blockY *= max (1, minPixels // (xSize * blockY))
+
+        for yOff in range (0, ySize, blockY):
+            for xOff in range (0, xSize, blockX):
+                yield xOff, yOff, min (blockX, xSize - xOff), min (blockY, ySize - yOff)
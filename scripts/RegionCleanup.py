@@ -1,7 +1,8 @@
-from RasterUtils import RasterUtils
 from DeNoiseFilter import DeNoiseFilter
 from MultiColorSweep import MultiColorSweep
 from ProductFinalizer import ProductFinalizer 
+from StagePipeline import StagePipeline
+from StageCheckpoint import StageCheckpoint
 
 import numpy as NPy
 
@@ -20,6 +21,9 @@ class RegionCleanup:
     MCQ_THRESHOLD           = 7
     MAJORITY_KERNEL_SIZE    = 5
 
+    STAGES                  = [(FILTER_STAGE  := "filter"),
+                               (PRODUCT_STAGE := "product")]
+
     def __init__ (self):
         ''' initializer '''
 
@@ -30,7 +34,8 @@ class RegionCleanup:
                    xres: float, 
                    yres: float,
                    nvreplace: Optional[Union[float, int]] = None,
-                   filterChoice: str = DENOISE_FILTER):
+                   filterChoice: str = DENOISE_FILTER,
+                   checkpoint: Optional[StageCheckpoint] = None):
 
         ''' run the cleanup procedure 
 
@@ -41,11 +46,19 @@ class RegionCleanup:
             @param xres: X-resolution of the final product 
             @param yres: Y-resolution of the final pproduct 
             @param nvreplace: replacement value for no-data pixels 
-            @param filterChoice: which filter to use '''
+            @param filterChoice: which filter to use 
+            @param checkpoint: if not None, skip the stages it marks as complete 
+                               and mark the others when they succeed '''
+
+        if checkpoint is None:
+            StagePipeline.runStage (StagePipeline.CPU, self.applyFilter, inputf, outputf, filterChoice)
+            StagePipeline.runStage (StagePipeline.IO, self.finalizeProduct, outputf, productf, proj4, xres, yres, nvreplace)
 
-        self.applyFilter (inputf, outputf, filterChoice)
-        self.finalizeProduct (outputf, productf, proj4, xres, yres)
-        self.nvReplace (productf, nvreplace) 
+        else:
+            StagePipeline.runStage (StagePipeline.CPU, checkpoint.run, self.FILTER_STAGE, [inputf], [outputf], 
+                                    self.applyFilter, inputf, outputf, filterChoice)
+            StagePipeline.runStage (StagePipeline.IO, checkpoint.run, self.PRODUCT_STAGE, [outputf], [productf], 
+                                    self.finalizeProduct, outputf, productf, proj4, xres, yres, nvreplace)
 
     def applyFilter (self, inputf: str, outputf: str, filterChoice: str):
         ''' apply denoising filter to the raw pixel map 
@@ -75,32 +88,28 @@ class RegionCleanup:
                                product: str, 
                                projection: str,
                                xresolution: float,
-                               yresolution: float):
+                               yresolution: float,
+                               nvreplace: Optional[Union[float, int]] = None):
 
-        ''' reproject to desired projection and adjust resolution 
+        ''' reproject to desired projection and adjust resolution; no-data 
+            pixels are replaced as part of the resampling 
             
             @param basemap: dataset to finalize 
             @param product: final product 
             @param projection: product projection 
             @param xresolution: X-resolution of the product 
-            @param yresolution: Y-resolution of the product '''
+            @param yresolution: Y-resolution of the product 
+            @param nvreplace: replacement value for no-data pixels (None to keep them) '''
 
         pf = ProductFinalizer (source = basemap,
                                product = product,
                                xres = xresolution,
                                yres = yresolution,
-                               proj4 = projection)
+                               proj4 = projection,
+                               nvreplace = nvreplace)
 
         pf.process ()
 
-    def nvReplace (self, datafile: str, replacement: Union[float, int, None]):
-        ''' replace the no-value pixels with pixels of set value 
-
-            @param datafile: file to operate on 
-            @param replacement: replacement value for no data pixels '''
-
-        RasterUtils.undeclareNoDataValue (datafile, replacement)
-
 # ................................... MAIN ..................................
 
 import sys 
@@ -0,0 +1,144 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from collections import namedtuple
+
+from osgeo import gdal
+from osgeo import ogr
+from osgeo import gdalconst as GC
+
+import os
+import sys
+
+class RegionScheduler:
+    ''' runs independent region jobs in a pool of worker processes; jobs are
+        started largest first and only while the sum of their estimated peak
+        memory fits into the memory budget of the host '''
+
+    BYTES_PER_PIXEL     = 16        # peak working set of a full region raster stage, per pixel
+    BYTES_PER_FEATURE   = 1024      # per CLU: envelope, IDs, zonal statistics record
+    MEMORY_FRACTION     = 0.8       # share of the host memory used as the default budget
+
+    RegionJob = namedtuple ("RegionJob", "name function args kwargs memory")
+
+    def __init__ (self, workers: Optional[int] = None,
+                        budget: Optional[int] = None,
+                        initializer: Optional[Callable] = None,
+                        initargs: Tuple = (),
+                        verbose: bool = False):
+
+        ''' initializer
+
+            @param workers: maximum number of regions processed at once (None for one per CPU)
+            @param budget: memory budget in bytes (None for MEMORY_FRACTION of the host memory)
+            @param initializer: called once in every worker process (e.g. to set up temporary files)
+            @param initargs: arguments of the initializer
+            @param verbose: if True, report job starts and ends '''
+
+        self.Workers = workers or os.cpu_count () or 1
+        self.Budget = budget if budget is not None else int (self.hostMemory () * self.MEMORY_FRACTION)
+        self.Initializer = initializer
+        self.InitArgs = initargs
+        self.Verbose = verbose
+        self.Jobs: List[Any] = []
+
+    @classmethod
+    def hostMemory (clss) -> int:
+        ''' physical memory of the host, in bytes '''
+
+        return os.sysconf ("SC_PAGE_SIZE") * os.sysconf ("SC_PHYS_PAGES")
+
+    @classmethod
+    def estimateMemory (clss, raster: str,
+                              clufile: Optional[str] = None,
+                              bytesPerPixel: int = BYTES_PER_PIXEL,
+                              bytesPerFeature: int = BYTES_PER_FEATURE) -> int:
+
+        ''' estimate peak memory of processing a region from the size of its
+            raster and the number of its CLUs
+
+            @param raster: basemap of the region
+            @param clufile: CLU file of the region, if any
+            @param bytesPerPixel: working set per pixel of the basemap
+            @param bytesPerFeature: working set per CLU
+            @return: estimated peak memory in bytes '''
+
+        ds = gdal.Open (raster, GC.GA_ReadOnly)
+        result = ds.RasterXSize * ds.RasterYSize * bytesPerPixel
+        ds = None
+
+        if clufile is not None and os.path.exists (clufile):
+            vds = ogr.Open (clufile, GC.GA_ReadOnly)
+            result += vds.GetLayer ().GetFeatureCount () * bytesPerFeature
+            vds = None
+
+        return result
+
+    def add (self, name: str, function: Callable, *args, memory: int = 0, **kwargs):
+        ''' add a region job
+
+            @param name: region name
+            @param function: module level function processing the region
+            @param args: its positional arguments
+            @param memory: estimated peak memory of the job, in bytes
+            @param kwargs: its keyword arguments '''
+
+        self.Jobs.append (self.RegionJob (name, function, args, kwargs, memory))
+
+    def run (self) -> Dict[str, Any]:
+        ''' run all jobs in order of decreasing memory; the next job is started
+            when a worker is free and its memory fits next to the running jobs
+            (a job larger than the whole budget runs alone)
+
+            @return: {region : result} of the jobs that succeeded; failures
+                     are reported and the first one is raised at the end '''
+
+        pending = sorted (self.Jobs, key = lambda job: job.memory, reverse = True)
+        running: Dict[Any, Any] = {}
+        results: Dict[str, Any] = {}
+        failures: Dict[str, BaseException] = {}
+        inUse = 0
+
+        with ProcessPoolExecutor (max_workers = self.Workers,
+                                  initializer = self.Initializer,
+                                  initargs = self.InitArgs) as executor:
+
+            while pending or running:
+                for job in list (pending):
+                    if len (running) >= self.Workers:
+                        break
+
+                    if running and inUse + job.memory > self.Budget:
+                        break       # keep the order, smaller jobs must not starve the large ones
+
+                    pending.remove (job)
+                    inUse += job.memory
+                    running[executor.submit (job.function, *job.args, **job.kwargs)] = job
+                    self.report (f" -> Started {job.name} ({job.memory / (1 << 30):.1f} GB)\n")
+
+                done, _running = wait (running, return_when = FIRST_COMPLETED)
+
+                for future in done:
+                    job = running.pop (future)
+                    inUse -= job.memory
+
+                    try:
+                        results[job.name] = future.result ()
+                        self.report (f" -> Finished {job.name}\n")
+                    except Exception as e:
+                        failures[job.name] = e
+                        sys.stderr.write (f" ! Processing of {job.name} FAILED: {e}\n")
+
+        self.Jobs = []
+
+        if failures:
+            raise next (iter (failures.values ()))
+
+        return results
+
+    def report (self, text: str):
+        ''' write progress information if verbose '''
+
+        if self.Verbose == True:
+            sys.stdout.write (text)
+            sys.stdout.flush ()
@@ -0,0 +1,123 @@
+from typing import Any, Tuple
+
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+from osgeo import gdal
+from osgeo import gdal_array
+from osgeo import gdalconst as GConst
+
+import numpy as NPy
+
+import os
+
+class SharedRaster:
+    ''' first band of a raster decoded once into named shared memory; worker
+        processes attach to it by its descriptor and see the pixels as a
+        read-only NumPy view, without copying or decoding them again. The
+        process that created it owns it and unlinks it when done '''
+
+    NAME_FMT        = "ctm_{key}_{pid}_{serial}"
+
+    Descriptor = namedtuple ("Descriptor", "name shape dtype geoTransform projection noDataValue")
+
+    Serial = 0
+
+    def __init__ (self, descriptor: Descriptor, memory: shared_memory.SharedMemory, owner: bool):
+        ''' initializer (use create or attach)
+
+            @param descriptor: what workers need to attach
+            @param memory: the shared memory block
+            @param owner: True in the process that created the block '''
+
+        self.Descriptor = descriptor
+        self.Memory = memory
+        self.Owner = owner
+        self.Data = NPy.ndarray (descriptor.shape, dtype = descriptor.dtype, buffer = memory.buf)
+
+        if not owner:
+            self.Data.flags.writeable = False
+
+    @classmethod
+    def create (clss, filename: str, key: str) -> "SharedRaster":
+        ''' decode a raster into a new shared memory block
+
+            @param filename: raster file
+            @param key: name part identifying the data (e.g. region and raster)
+            @return: owning instance '''
+
+        ds = gdal.Open (filename, GConst.GA_ReadOnly)
+        band = ds.GetRasterBand (1)
+        dtype = NPy.dtype (gdal_array.GDALTypeCodeToNumericTypeCode (band.DataType))
+        shape = (ds.RasterYSize, ds.RasterXSize)
+
+        clss.Serial += 1
+        name = clss.NAME_FMT.format (key = key, pid = os.getpid (), serial = clss.Serial)
+        memory = shared_memory.SharedMemory (name = name, create = True,
+                                             size = max (1, int (NPy.prod (shape)) * dtype.itemsize))
+
+        descriptor = clss.Descriptor (name, shape, dtype.str,
+                                      ds.GetGeoTransform (), ds.GetProjection (),
+                                      band.GetNoDataValue ())
+        result = clss (descriptor, memory, owner = True)
+
+        try:
+            band.ReadAsArray (buf_obj = result.Data)     # decode straight into the block
+        except Exception:
+            result.unlink ()
+            raise
+        finally:
+            ds = None
+
+        return result
+
+    @classmethod
+    def attach (clss, descriptor: Descriptor) -> "SharedRaster":
+        ''' attach to a shared raster created by another process
+
+            @param descriptor: descriptor of the shared raster
+            @return: instance with a read-only view '''
+
+        try:
+            memory = shared_memory.SharedMemory (name = descriptor.name, track = False)
+        except TypeError:                       # no untracked attach before Python 3.13
+            memory = shared_memory.SharedMemory (name = descriptor.name)
+
+        return clss (descriptor, memory, owner = False)
+
+    def gdalType (self) -> int:
+        ''' GDAL data type of the pixels '''
+
+        return gdal_array.NumericTypeCodeToGDALTypeCode (NPy.dtype (self.Descriptor.dtype))
+
+    def close (self):
+        ''' detach from the block; views of Data must not be used afterwards '''
+
+        if self.Memory is not None:
+            self.Data = None
+
+            try:
+                self.Memory.close ()
+            except BufferError:
+                pass            # views still alive (e.g. in a traceback), the mapping goes with them
+
+            self.Memory = None
+
+    def unlink (self):
+        ''' detach and, in the owning process, free the block '''
+
+        memory = self.Memory
+        self.close ()
+
+        if self.Owner and memory is not None:
+            memory.unlink ()
+
+    def __enter__ (self) -> "SharedRaster":
+        ''' use as a context, freed (or detached) at its end '''
+
+        return self
+
+    def __exit__ (self, *_exc: Tuple[Any, ...]):
+        ''' free (or detach) at the end of the context '''
+
+        self.unlink ()
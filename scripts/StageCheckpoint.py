@@ -0,0 +1,128 @@
+import json
+import os
+
+from typing import Any, Dict, List, Optional
+
+from FileFingerprint import FileFingerprint
+
+class StageCheckpoint:
+    ''' completion markers of the stages of a region: one small file per
+        stage, written atomically only after the stage succeeded and its
+        outputs were flushed to disk. A marker holds the identity of the
+        inputs and outputs of the stage: an output that was touched or
+        truncated afterwards does not count as complete, and a stage whose
+        inputs were rebuilt since is run again '''
+
+    SUBDIR          = ".checkpoints"
+    MARKER_FMT      = "{stage}.done"
+    VERSION         = 1
+
+    def __init__ (self, regiondir: str):
+        ''' initializer
+
+            @param regiondir: directory of the region; markers go to a
+                              subdirectory of it '''
+
+        self.Path = os.path.join (regiondir, self.SUBDIR)
+
+    def marker (self, stage: str) -> str:
+        ''' file name of the marker of a stage '''
+
+        return os.path.join (self.Path, self.MARKER_FMT.format (stage = stage))
+
+    def isComplete (self, stage: str, inputs: List[str], outputs: List[str]) -> bool:
+        ''' check whether a stage finished, from the same inputs, and its
+            outputs are still what it wrote
+
+            @param stage: stage name
+            @param inputs: files the stage reads
+            @param outputs: files the stage writes
+            @return: True if the stage can be skipped '''
+
+        stored = self.read (stage)
+
+        return stored is not None and \
+               all (os.path.exists (output) for output in outputs) and \
+               stored["inputs"] == FileFingerprint.identities (inputs) and \
+               stored["outputs"] == FileFingerprint.identities (outputs)
+
+    def read (self, stage: str) -> Optional[Dict[str, Any]]:
+        ''' read the marker of a stage, if there is a valid one '''
+
+        result = None
+        marker = self.marker (stage)
+
+        if os.path.exists (marker):
+            try:
+                with open (marker) as f:
+                    stored = json.load (f)
+            except ValueError:
+                stored = {}             # torn marker of a file system without atomic renames
+
+            if stored.get ("version") == self.VERSION:
+                result = stored
+
+        return result
+
+    def complete (self, stage: str, inputs: List[str], outputs: List[str]):
+        ''' mark a stage as complete: flush its outputs, then write the marker
+            to a temporary file and rename it into place
+
+            @param stage: stage name
+            @param inputs: files the stage read
+            @param outputs: files the stage wrote '''
+
+        for output in outputs:
+            self.sync (output)
+
+        os.makedirs (self.Path, exist_ok = True)
+
+        FileFingerprint.writeJSON (self.marker (stage),
+                                   {"version" : self.VERSION,
+                                    "stage"   : stage,
+                                    "inputs"  : FileFingerprint.identities (inputs),
+                                    "outputs" : FileFingerprint.identities (outputs)})
+        self.sync (self.Path)
+
+    def clear (self, stage: str):
+        ''' remove the marker of a stage (it is about to be rerun) '''
+
+        marker = self.marker (stage)
+
+        if os.path.exists (marker):
+            os.remove (marker)
+            self.sync (self.Path)
+
+    def run (self, stage: str, inputs: List[str], outputs: List[str], function, *args, **kwargs) -> bool:
+        ''' run a stage unless it is complete; partial outputs of an earlier,
+            interrupted run are removed first
+
+            @param stage: stage name
+            @param inputs: files the stage reads
+            @param outputs: files the stage writes
+            @param function: the stage
+            @return: True if the stage ran, False if it was skipped '''
+
+        if self.isComplete (stage, inputs, outputs):
+            return False
+
+        self.clear (stage)
+
+        for output in outputs:
+            if os.path.exists (output):
+                os.remove (output)
+
+        function (*args, **kwargs)
+        self.complete (stage, inputs, outputs)
+
+        return True
+
+    @classmethod
+    def sync (clss, filename: str):
+        ''' flush a file or directory to disk '''
+
+        fd = os.open (filename, os.O_RDONLY)
+        try:
+            os.fsync (fd)
+        finally:
+            os.close (fd)
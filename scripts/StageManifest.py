@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+
+from typing import Any, Dict, List, Optional
+
+from FileFingerprint import FileFingerprint
+
+class StageManifest:
+    ''' build record of the stages of a region: the fingerprint each stage was
+        last built with and the identity of the files it produced. A stage
+        fingerprint covers the stage name, its parameters, the content of its
+        external inputs and the fingerprints of the stages that produced its
+        other inputs, so a change reruns exactly the stages downstream of it '''
+
+    VERSION         = 1
+    DIGEST_SIZE     = 16
+
+    # files that belong to a vector dataset besides its main file
+    COMPONENTS      = {".shp" : [".shx", ".dbf", ".prj", ".cpg"]}
+
+    def __init__ (self, filename: str):
+        ''' initializer
+
+            @param filename: manifest file (created on first record) '''
+
+        self.Filename = filename
+        self.Stages: Dict[str, Dict[str, Any]] = {}
+        self.Digests: Dict[str, List[Any]] = {}         # {file : [size, mtime, digest]}
+
+        if os.path.exists (filename):
+            with open (filename) as f:
+                stored = json.load (f)
+
+            if stored.get ("version") == self.VERSION:
+                self.Stages = stored.get ("stages", {})
+                self.Digests = stored.get ("digests", {})
+
+    def fingerprint (self, name: str,
+                           inputs: List[str],
+                           params: Dict[str, Any]) -> str:
+
+        ''' fingerprint of a stage
+
+            @param name: stage name
+            @param inputs: files the stage reads
+            @param params: parameters the result depends on
+            @return: hex digest '''
+
+        hasher = hashlib.blake2b (digest_size = self.DIGEST_SIZE)
+        hasher.update (name.encode ())
+        hasher.update (json.dumps (params, sort_keys = True, default = str).encode ())
+
+        for filename in inputs:
+            hasher.update (filename.encode ())
+            hasher.update ((self.producer (filename) or self.digest (filename)).encode ())
+
+        return hasher.hexdigest ()
+
+    def producer (self, filename: str) -> Optional[str]:
+        ''' fingerprint of the stage that produced a file, if it was produced
+            by a recorded stage and has not been touched since '''
+
+        result = None
+
+        for record in self.Stages.values ():
+            if filename in record["outputs"] and FileFingerprint.identities ([filename]) == {filename : record["outputs"][filename]}:
+                result = record["fingerprint"]
+                break
+
+        return result
+
+    def digest (self, filename: str) -> str:
+        ''' content digest of a file and its components; digests are kept in
+            the manifest and reused while the files keep their identity '''
+
+        digests = []
+
+        for part in self.components (filename):
+            identity = list (FileFingerprint.identity (part))
+            known = self.Digests.get (part)
+
+            if known is None or known[:2] != identity:
+                known = identity + [FileFingerprint.digest (part)]
+                self.Digests[part] = known
+
+            digests.append (known[2])
+
+        return ":".join (digests)
+
+    def components (self, filename: str) -> List[str]:
+        ''' the file itself and its existing companion files '''
+
+        root, ext = os.path.splitext (filename)
+        others = [root + other for other in self.COMPONENTS.get (ext.lower (), [])]
+
+        return [filename] + [other for other in others if os.path.exists (other)]
+
+    def isCurrent (self, name: str, fingerprint: str, outputs: List[str]) -> bool:
+        ''' check whether a stage was built with the same fingerprint and its
+            outputs still are what it wrote
+
+            @param name: stage name
+            @param fingerprint: current fingerprint of the stage
+            @param outputs: files the stage writes
+            @return: True if the stage can be skipped '''
+
+        record = self.Stages.get (name)
+
+        return record is not None and \
+               record["fingerprint"] == fingerprint and \
+               None not in FileFingerprint.identities (outputs).values () and \
+               record["outputs"] == FileFingerprint.identities (outputs)
+
+    def record (self, name: str, fingerprint: str, outputs: List[str]):
+        ''' record a freshly built stage and save the manifest
+
+            @param name: stage name
+            @param fingerprint: fingerprint it was built with
+            @param outputs: files it wrote '''
+
+        self.Stages[name] = {"fingerprint" : fingerprint,
+                             "outputs"     : FileFingerprint.identities (outputs)}
+        self.save ()
+
+    def invalidate (self, name: str):
+        ''' forget a stage (it is about to be rebuilt) '''
+
+        if self.Stages.pop (name, None) is not None:
+            self.save ()
+
+    def save (self):
+        ''' write the manifest atomically '''
+
+        FileFingerprint.writeJSON (self.Filename,
+                                   {"version" : self.VERSION,
+                                    "stages"  : self.Stages,
+                                    "digests" : self.Digests})
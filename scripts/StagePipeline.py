@@ -0,0 +1,96 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from contextlib import nullcontext
+
+import multiprocessing
+import os
+
+from RegionScheduler import RegionScheduler
+
+class StagePipeline:
+    ''' pipelines the stages of many regions: every region runs in its own
+        worker process and walks through its stage graph, but a stage only
+        starts when a slot of its resource class is free; with more regions
+        in flight than CPU slots, the I/O stages of some regions overlap
+        with the CPU stages of others '''
+
+    RESOURCES       = [(CPU := "cpu"),      # NumPy work: sweeps, merges, zonal statistics
+                       (IO  := "io")]       # subprocesses, warps, copies, vector updates
+
+    IO_SHARE        = 4                     # default I/O slots: one per this many CPU slots
+
+    # slot semaphores of the current process (set in the workers; empty
+    # means stages run unrestricted, e.g. in a plain sequential run)
+    Slots: Dict[str, Any] = {}
+
+    @classmethod
+    def createSlots (clss, cpu: Optional[int] = None, io: Optional[int] = None) -> Dict[str, Any]:
+        ''' create the slot semaphores shared by all worker processes
+
+            @param cpu: number of CPU stages running at once (None for one per CPU)
+            @param io: number of I/O stages running at once (None for a share of the CPU slots)
+            @return: {resource : semaphore} '''
+
+        cpu = cpu or os.cpu_count () or 1
+        io = io or max (1, cpu // clss.IO_SHARE)
+
+        return {clss.CPU : multiprocessing.Semaphore (cpu),
+                clss.IO  : multiprocessing.Semaphore (io)}
+
+    @classmethod
+    def initWorker (clss, slots: Dict[str, Any],
+                          initializer: Optional[Callable] = None,
+                          initargs: Tuple = ()):
+
+        ''' set up a worker process: remember the slots, then run the
+            caller's own initializer '''
+
+        clss.Slots = slots
+
+        if initializer is not None:
+            initializer (*initargs)
+
+    @classmethod
+    def runStage (clss, resource: str, function: Callable, *args, **kwargs) -> Any:
+        ''' run one stage while holding a slot of its resource class
+
+            @param resource: one of RESOURCES
+            @param function: the stage
+            @return: result of the stage '''
+
+        if resource not in clss.RESOURCES:
+            raise ValueError (f"Unknown resource class '{resource}'")
+
+        slot = clss.Slots.get (resource)
+
+        with slot if slot is not None else nullcontext ():
+            return function (*args, **kwargs)
+
+    @classmethod
+    def scheduler (clss, cpu: Optional[int] = None,
+                         io: Optional[int] = None,
+                         budget: Optional[int] = None,
+                         initializer: Optional[Callable] = None,
+                         initargs: Tuple = (),
+                         verbose: bool = False) -> RegionScheduler:
+
+        ''' region scheduler whose workers share stage slots; it keeps as
+            many regions in flight as there are slots of both classes
+            (memory budget permitting)
+
+            @param cpu: CPU slots (None for one per CPU)
+            @param io: I/O slots (None for a share of the CPU slots)
+            @param budget: memory budget in bytes (see RegionScheduler)
+            @param initializer: called once in every worker process
+            @param initargs: arguments of the initializer
+            @param verbose: if True, report job starts and ends
+            @return: scheduler to add the region jobs to '''
+
+        cpu = cpu or os.cpu_count () or 1
+        io = io or max (1, cpu // clss.IO_SHARE)
+
+        return RegionScheduler (workers = cpu + io,
+                                budget = budget,
+                                initializer = clss.initWorker,
+                                initargs = (clss.createSlots (cpu, io), initializer, initargs),
+                                verbose = verbose)
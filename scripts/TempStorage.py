@@ -0,0 +1,145 @@
+from typing import Dict, Iterator, Optional
+
+from contextlib import contextmanager
+
+from osgeo import gdal
+from osgeo import gdalconst as GConst
+
+import atexit
+import os
+import shutil
+import tempfile
+
+from Utils.TmpFileUtils import TmpFileUtils
+
+class TempStorage:
+    ''' temporary rasters in memory-backed storage (tmpfs) first: a temporary
+        whose expected size still fits into the budget of the process goes to
+        a RAM directory, larger ones spill to the regular temporary files on
+        disk. Files on tmpfs are visible to external tools, unlike /vsimem.
+        The RAM directory belongs to the process that initialized it and is
+        removed on cleanup or exit, also after failures '''
+
+    RAM_ROOT        = "/dev/shm"
+    RAM_DIR_FMT     = "{prefix}{pid}"
+    RAM_FRACTION    = 0.5       # share of the free tmpfs space used by default
+    WARP_GROWTH     = 1.5       # uncompressed warp output relative to the source pixels
+
+    RamDir: Optional[str] = None
+    Budget: int = 0
+    Reserved: Dict[str, int] = {}
+    Owner: Optional[int] = None
+
+    @classmethod
+    def init (clss, prefix: str, budget: Optional[int] = None, shares: int = 1) -> Optional[str]:
+        ''' create the RAM directory of a run (in the main process)
+
+            @param prefix: name prefix of the directory
+            @param budget: bytes of temporaries kept in RAM by all processes
+                           (None for a share of the free tmpfs space)
+            @param shares: number of processes sharing the budget
+            @return: RAM directory (None if there is no tmpfs) '''
+
+        clss.RamDir = None
+        clss.Budget = 0
+
+        if os.path.isdir (clss.RAM_ROOT) and os.access (clss.RAM_ROOT, os.W_OK):
+            ramdir = os.path.join (clss.RAM_ROOT, clss.RAM_DIR_FMT.format (prefix = prefix, pid = os.getpid ()))
+            os.makedirs (ramdir, exist_ok = True)
+
+            budget = budget if budget is not None else clss.ramBudget ()
+            clss.attach (ramdir, budget // max (1, shares))
+            clss.Owner = os.getpid ()
+            atexit.register (clss.cleanup)
+
+        return clss.RamDir
+
+    @classmethod
+    def attach (clss, ramdir: Optional[str], budget: int):
+        ''' use the RAM directory of the main process (in a worker process)
+
+            @param ramdir: RAM directory (None to keep all temporaries on disk)
+            @param budget: bytes of temporaries this process keeps in RAM '''
+
+        clss.RamDir = ramdir
+        clss.Budget = budget if ramdir is not None else 0
+        clss.Reserved = {}
+
+    @classmethod
+    def ramBudget (clss) -> int:
+        ''' default budget: a share of the free space of the tmpfs '''
+
+        st = os.statvfs (clss.RAM_ROOT)
+
+        return int (st.f_bavail * st.f_frsize * clss.RAM_FRACTION)
+
+    @classmethod
+    def rasterSize (clss, filename: str, growth: float = 1.0) -> int:
+        ''' expected size of an uncompressed raster derived from another one
+
+            @param filename: source raster
+            @param growth: size of the derived raster relative to the source
+            @return: bytes '''
+
+        ds = gdal.Open (filename, GConst.GA_ReadOnly)
+        band = ds.GetRasterBand (1)
+        pixelSize = gdal.GetDataTypeSize (band.DataType) // 8
+        result = int (ds.RasterXSize * ds.RasterYSize * ds.RasterCount * pixelSize * growth)
+        ds = None
+
+        return result
+
+    @classmethod
+    def newTmp (clss, like: str, size: int) -> str:
+        ''' name of a new temporary file, in RAM if it fits into the budget
+
+            @param like: file whose extension the temporary gets
+            @param size: expected size of the temporary, in bytes
+            @return: file name (release it when done) '''
+
+        if clss.RamDir is not None and sum (clss.Reserved.values ()) + size <= clss.Budget:
+            _root, ext = os.path.splitext (like)
+            fd, result = tempfile.mkstemp (suffix = ext, dir = clss.RamDir)
+            os.close (fd)
+            os.unlink (result)              # writers create the file themselves
+            clss.Reserved[result] = size
+        else:
+            result = TmpFileUtils.newTmp (like)
+
+        return result
+
+    @classmethod
+    def release (clss, filename: str):
+        ''' delete a temporary file and give its budget back '''
+
+        clss.Reserved.pop (filename, None)
+
+        if os.path.exists (filename):
+            os.unlink (filename)
+
+    @classmethod
+    @contextmanager
+    def temporary (clss, like: str, size: int) -> Iterator[str]:
+        ''' temporary file for the duration of a block, released also when
+            the block fails
+
+            @param like: file whose extension the temporary gets
+            @param size: expected size of the temporary, in bytes
+            @return: context yielding the file name '''
+
+        filename = clss.newTmp (like, size)
+
+        try:
+            yield filename
+        finally:
+            clss.release (filename)
+
+    @classmethod
+    def cleanup (clss):
+        ''' remove the RAM directory with everything left in it (only in
+            the process that created it) '''
+
+        if clss.Owner == os.getpid () and clss.RamDir is not None:
+            shutil.rmtree (clss.RamDir, ignore_errors = True)
+            clss.RamDir = None
+            clss.Reserved = {}
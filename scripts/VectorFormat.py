@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+from typing import Iterator, Optional, Tuple
+
+from contextlib import contextmanager
+
+from osgeo import gdal
+from osgeo import ogr
+from osgeo import gdalconst as GC
+
+import os
+import sys
+import shutil
+
+class VectorFormat:
+    ''' format aware handling of CLU vector files: ESRI shapefiles, and the
+        spatially indexed GeoPackage and FlatGeobuf '''
+
+    FORMATS                 = [(SHAPEFILE  := "ESRI Shapefile"),
+                               (GEOPACKAGE := "GPKG"),
+                               (FLATGEOBUF := "FlatGeobuf")]
+
+    EXTENSIONS              = {".shp"  : SHAPEFILE,
+                               ".gpkg" : GEOPACKAGE,
+                               ".fgb"  : FLATGEOBUF}
+
+    # all files a shapefile may consist of, besides the .shp itself
+    SHAPEFILE_COMPONENTS    = [".shx", ".dbf", ".prj", ".cpg", ".qix", ".sbn", ".sbx"]
+
+    UPDATE_FMT              = "{root}.update.gpkg"
+    TMP_FMT                 = "{root}.tmp{ext}"
+
+    TWindow = Tuple[float, float, float, float]     # west, south, east, north
+
+    @classmethod
+    def driverName (clss, filename: str) -> str:
+        ''' OGR driver for a file, by its extension
+
+            @param filename: vector file
+            @return: driver name, one of FORMATS '''
+
+        _root, ext = os.path.splitext (filename)
+
+        if ext.lower () not in clss.EXTENSIONS:
+            raise ValueError (f"Unsupported vector format '{ext}' of {filename}")
+
+        return clss.EXTENSIONS[ext.lower ()]
+
+    @classmethod
+    def isUpdatable (clss, filename: str) -> bool:
+        ''' check whether features of a file can be updated in place
+            (FlatGeobuf files are written once) '''
+
+        return clss.driverName (filename) != clss.FLATGEOBUF
+
+    @classmethod
+    def locate (clss, filename: str) -> str:
+        ''' find the file of a vector dataset, trying all supported formats
+            when the named file does not exist
+
+            @param filename: preferred file name
+            @return: existing file with the same root, or the preferred name '''
+
+        result = filename
+
+        if not os.path.exists (filename):
+            root, _ext = os.path.splitext (filename)
+
+            for ext in clss.EXTENSIONS:
+                if os.path.exists (root + ext):
+                    result = root + ext
+                    break
+
+        return result
+
+    @classmethod
+    def copy (clss, source: str, destination: str):
+        ''' copy a vector file with all its components; a destination in a
+            different format is converted
+
+            @param source: file to copy
+            @param destination: name of the copy '''
+
+        if clss.driverName (source) != clss.driverName (destination):
+            clss.convert (source, destination)
+
+        elif clss.driverName (source) == clss.SHAPEFILE:
+            sourceRoot, _ext = os.path.splitext (source)
+            targetRoot, _ext = os.path.splitext (destination)
+            shutil.copy (source, destination)
+
+            for component in clss.SHAPEFILE_COMPONENTS:
+                if os.path.exists (sourceRoot + component):
+                    shutil.copy (sourceRoot + component, targetRoot + component)
+
+        else:
+            shutil.copy (source, destination)
+
+    @classmethod
+    def convert (clss, source: str, destination: str, spatialIndex: bool = True):
+        ''' convert a vector file to the format of the destination, building
+            the spatial index of the output format
+
+            @param source: file to convert
+            @param destination: output file (format by extension)
+            @param spatialIndex: if True, create the spatial index '''
+
+        driverName = clss.driverName (destination)
+        root, ext = os.path.splitext (destination)
+        tmpFile = clss.TMP_FMT.format (root = root, ext = ext)
+
+        layerOptions = []
+        if driverName != clss.SHAPEFILE:
+            layerOptions.append ("SPATIAL_INDEX={0}".format ("YES" if spatialIndex else "NO"))
+
+        clss.remove (tmpFile)
+        options = gdal.VectorTranslateOptions (format = driverName,
+                                               layerCreationOptions = layerOptions)
+        ds = gdal.VectorTranslate (tmpFile, source, options = options)
+        ds = None
+
+        if driverName == clss.SHAPEFILE and spatialIndex:
+            clss.indexShapefile (tmpFile)
+
+        clss.remove (destination)
+        clss.rename (tmpFile, destination)
+
+    @classmethod
+    def indexShapefile (clss, filename: str):
+        ''' create the .qix spatial index of a shapefile '''
+
+        ds = ogr.Open (filename, GC.GA_Update)
+        layer = ds.GetLayer ()
+        ds.ExecuteSQL (f'CREATE SPATIAL INDEX ON "{layer.GetName ()}"')
+        ds = None
+
+    @classmethod
+    def open (clss, filename: str,
+                    window: Optional[TWindow] = None,
+                    update: bool = False):
+
+        ''' open the (first) layer of a vector file, optionally restricted to
+            features whose envelopes intersect a window; indexed formats only
+            visit the matching features
+
+            @param filename: vector file
+            @param window: (west, south, east, north) in layer coordinates
+            @param update: open for update
+            @return: dataset and layer (keep the dataset while using the layer) '''
+
+        ds = ogr.Open (filename, GC.GA_Update if update else GC.GA_ReadOnly)
+        layer = ds.GetLayer ()
+
+        if window is not None:
+            layer.SetSpatialFilterRect (*window)
+
+        return ds, layer
+
+    @classmethod
+    @contextmanager
+    def openForUpdate (clss, filename: str) -> Iterator[Tuple[ogr.DataSource, ogr.Layer]]:
+        ''' open the layer of a vector file for feature updates, in a single
+            transaction where the format has them; files that cannot be
+            updated in place (FlatGeobuf) are edited as a GeoPackage and
+            rebuilt, with their spatial index, when the edit is done
+
+            @param filename: vector file
+            @return: context yielding dataset and layer '''
+
+        if clss.isUpdatable (filename):
+            editFile = filename
+        else:
+            root, _ext = os.path.splitext (filename)
+            editFile = clss.UPDATE_FMT.format (root = root)
+            clss.convert (filename, editFile, spatialIndex = False)
+
+        ds, layer = clss.open (editFile, update = True)
+        transaction = ds.TestCapability (ogr.ODsCTransactions)
+        done = False
+
+        try:
+            if transaction:
+                ds.StartTransaction ()
+
+            yield ds, layer
+
+            if transaction:
+                ds.CommitTransaction ()
+            done = True
+
+        finally:
+            if transaction and not done:
+                ds.RollbackTransaction ()
+
+            layer = None
+            ds = None
+
+            if editFile != filename:
+                if done:
+                    clss.convert (editFile, filename)
+                clss.remove (editFile)
+
+    @classmethod
+    def remove (clss, filename: str):
+        ''' delete a vector file with all its components, if it exists '''
+
+        if os.path.exists (filename):
+            gdal.GetDriverByName (clss.driverName (filename)).Delete (filename)
+
+    @classmethod
+    def rename (clss, source: str, destination: str):
+        ''' rename a vector file with all its components '''
+
+        if clss.driverName (source) == clss.SHAPEFILE:
+            sourceRoot, _ext = os.path.splitext (source)
+            targetRoot, _ext = os.path.splitext (destination)
+
+            for component in [".shp"] + clss.SHAPEFILE_COMPONENTS:
+                if os.path.exists (sourceRoot + component):
+                    os.replace (sourceRoot + component, targetRoot + component)
+        else:
+            os.replace (source, destination)
+
+# ..................................... MAIN ................................
+
+if __name__ == "__main__":
+
+    MINIMUM_ARGS = 2
+
+    args = sys.argv[1:]
+    nArgs = len (args)
+
+    if nArgs >= MINIMUM_ARGS and "." + args[0].lstrip (".") in VectorFormat.EXTENSIONS:
+        ext = "." + args[0].lstrip (".")
+
+        for source in args[1:]:
+            root, _ext = os.path.splitext (source)
+            sys.stdout.write (f"Converting {source} -> {root + ext} ...\n")
+            VectorFormat.convert (source, root + ext)
+
+    else:
+        app = os.path.basename (sys.argv[0])
+        sys.stderr.write (f"\nUSAGE: [python3] {app} gpkg|fgb|shp file1.shp [file2.shp ...]\n\n")
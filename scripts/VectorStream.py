@@ -0,0 +1,231 @@
+from typing import Dict, Iterator, List, Optional
+
+from osgeo import ogr
+
+import numpy as NPy
+
+try:
+    import shapely
+except ImportError:     # envelopes are then computed by OGR, one geometry at a time
+    shapely = None
+
+class VectorStream:
+    ''' bulk reading of vector layers as NumPy columns, in batches; uses the
+        OGR Arrow stream interface where available and falls back to plain
+        feature iteration elsewhere '''
+
+    BATCH_SIZE      = 1 << 16
+
+    FID             = "fid"
+    ENVELOPE        = "envelope"    # N x 4 (west, east, south, north), the order of OGR envelopes
+    GEOMETRY_TYPE   = "type"        # flat (2D) OGR geometry type, 0 for missing geometries
+    WKB             = "wkb"         # geometry blobs
+
+    TBatch = Dict[str, NPy.ndarray]
+
+    def __init__ (self, layer,
+                        fields: Optional[List[str]] = None,
+                        geometry: bool = True,
+                        wkb: bool = False,
+                        batchSize: int = BATCH_SIZE):
+
+        ''' initializer
+
+            @param layer: OGR layer to read (its filters apply)
+            @param fields: attribute fields to read
+            @param geometry: read envelopes and geometry types
+            @param wkb: also return the geometry blobs
+            @param batchSize: maximum number of features in a batch '''
+
+        self.Layer = layer
+        self.Fields = fields or []
+        self.Geometry = geometry or wkb
+        self.WKB = wkb
+        self.BatchSize = batchSize
+
+    def batches (self) -> Iterator[TBatch]:
+        ''' iterate over the layer in batches
+
+            @return: iterator of {column : array} with FID, the requested fields
+                     and (if requested) ENVELOPE, GEOMETRY_TYPE and WKB columns '''
+
+        if hasattr (self.Layer, "GetArrowStreamAsNumPy"):
+            yield from self.arrowBatches ()
+        else:
+            yield from self.featureBatches ()
+
+    def readAll (self, limit: Optional[int] = None) -> TBatch:
+        ''' read the whole layer
+
+            @param limit: if not None, read at most this many features
+            @return: {column : array} for all features, in layer order '''
+
+        columns: Dict[str, List[NPy.ndarray]] = {}
+        nRead = 0
+
+        for batch in self.batches ():
+            if limit is not None and nRead + len (batch[self.FID]) > limit:
+                batch = {name : column[:limit - nRead] for name, column in batch.items ()}
+
+            for name, column in batch.items ():
+                columns.setdefault (name, []).append (column)
+
+            nRead += len (batch[self.FID])
+            if limit is not None and nRead >= limit:
+                break
+
+        if not columns:
+            columns = {name : [column] for name, column in self.emptyBatch ().items ()}
+
+        return {name : NPy.concatenate (parts) for name, parts in columns.items ()}
+
+    def arrowBatches (self) -> Iterator[TBatch]:
+        ''' read batches through the Arrow stream '''
+
+        layerDefn = self.Layer.GetLayerDefn ()
+        ignored = [layerDefn.GetFieldDefn (i).GetName () for i in range (layerDefn.GetFieldCount ())
+                   if layerDefn.GetFieldDefn (i).GetName () not in self.Fields]
+        if not self.Geometry:
+            ignored.append ("OGR_GEOMETRY")
+
+        options = ["INCLUDE_FID=YES",
+                   f"MAX_FEATURES_IN_BATCH={self.BatchSize}",
+                   "GEOMETRY_ENCODING=WKB"]
+
+        fidColumn = self.Layer.GetFIDColumn () or "OGC_FID"
+        geomColumn = self.Layer.GetGeometryColumn () or "wkb_geometry"
+
+        self.Layer.SetIgnoredFields (ignored)
+
+        try:
+            stream = self.Layer.GetArrowStreamAsNumPy (options = options)
+
+            for arrowBatch in stream:
+                batch = {self.FID : NPy.array (arrowBatch[fidColumn], dtype = NPy.int64)}
+
+                for name in self.Fields:
+                    batch[name] = NPy.array (arrowBatch[name])   # copy, the stream reuses its buffers
+
+                if self.Geometry:
+                    batch.update (self.describeGeometries (arrowBatch[geomColumn]))
+
+                yield batch
+
+            stream = None
+
+        finally:
+            self.Layer.SetIgnoredFields ([])
+
+    def featureBatches (self) -> Iterator[TBatch]:
+        ''' read batches feature by feature (no Arrow support) '''
+
+        self.Layer.ResetReading ()
+        rows: List[ogr.Feature] = []
+
+        for feature in self.Layer:
+            rows.append (feature)
+
+            if len (rows) == self.BatchSize:
+                yield self.featureBatch (rows)
+                rows = []
+
+        if rows:
+            yield self.featureBatch (rows)
+
+    def featureBatch (self, features: List[ogr.Feature]) -> TBatch:
+        ''' turn a list of features into a batch '''
+
+        batch = {self.FID : NPy.array ([f.GetFID () for f in features], dtype = NPy.int64)}
+
+        for name in self.Fields:
+            batch[name] = NPy.array ([f.GetField (name) for f in features])
+
+        if self.Geometry:
+            blobs = NPy.empty (len (features), dtype = object)
+            blobs[:] = [bytes (g.ExportToIsoWkb ()) if (g := f.GetGeometryRef ()) is not None else None
+                        for f in features]
+            batch.update (self.describeGeometries (blobs))
+
+        return batch
+
+    def describeGeometries (self, blobs: NPy.ndarray) -> TBatch:
+        ''' compute envelopes and types of WKB geometries
+
+            @param blobs: object array of WKB blobs (None for missing geometries)
+            @return: ENVELOPE, GEOMETRY_TYPE and (if requested) WKB columns '''
+
+        n = len (blobs)
+        envelopes = NPy.full ((n, 4), NPy.nan)
+        types = NPy.zeros (n, dtype = NPy.int32)
+        present = NPy.array ([b is not None for b in blobs], dtype = bool)
+
+        for i in NPy.flatnonzero (present).tolist ():
+            types[i] = self.wkbType (blobs[i])
+
+        if shapely is not None:
+            geoms = shapely.from_wkb (blobs[present])
+            bounds = shapely.bounds (geoms)           # minx, miny, maxx, maxy
+            envelopes[present] = bounds[:, [0, 2, 1, 3]]
+        else:
+            for i in NPy.flatnonzero (present).tolist ():
+                envelopes[i] = ogr.CreateGeometryFromWkb (blobs[i]).GetEnvelope ()
+
+        result = {self.ENVELOPE : envelopes, self.GEOMETRY_TYPE : types}
+        if self.WKB:
+            result[self.WKB] = blobs
+
+        return result
+
+    def emptyBatch (self) -> TBatch:
+        ''' batch with no features (typed columns of an empty layer) '''
+
+        batch = {self.FID : NPy.zeros (0, dtype = NPy.int64)}
+
+        for name in self.Fields:
+            batch[name] = NPy.zeros (0)
+
+        if self.Geometry:
+            batch[self.ENVELOPE] = NPy.zeros ((0, 4))
+            batch[self.GEOMETRY_TYPE] = NPy.zeros (0, dtype = NPy.int32)
+        if self.WKB:
+            batch[self.WKB] = NPy.empty (0, dtype = object)
+
+        return batch
+
+    @classmethod
+    def wkbType (clss, blob: bytes) -> int:
+        ''' flat geometry type from a WKB header (ISO, or OGR 2.5D flags) '''
+
+        order = "little" if blob[0] == 1 else "big"
+        code = int.from_bytes (blob[1:5], order)
+
+        return (code & 0x0fffffff) % 1000
+
+    @classmethod
+    def updateFields (clss, layer, fids: NPy.ndarray, columns: Dict[int, NPy.ndarray]):
+        ''' write field values of many features; only the given fields are
+            rewritten (UpdateFeature), other fields and geometries are not
+            touched where the driver supports partial updates
+
+            @param layer: layer opened for update
+            @param fids: feature IDs
+            @param columns: {field index : values, one per feature} '''
+
+        indexes = list (columns.keys ())
+        values = [column.tolist () for column in columns.values ()]
+
+        if hasattr (layer, "UpdateFeature"):
+            feature = ogr.Feature (layer.GetLayerDefn ())
+
+            for i, fid in enumerate (fids.tolist ()):
+                feature.SetFID (fid)
+                for index, column in zip (indexes, values):
+                    feature.SetField (index, column[i])
+                layer.UpdateFeature (feature, indexes, [], False)
+
+        else:
+            for i, fid in enumerate (fids.tolist ()):
+                feature = layer.GetFeature (fid)
+                for index, column in zip (indexes, values):
+                    feature.SetField (index, column[i])
+                layer.SetFeature (feature)